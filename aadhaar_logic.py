@@ -1,9 +1,16 @@
 import cv2
-import pytesseract
+import os
 import re
 import numpy as np
 import random
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from preprocess_logic import otsu_threshold
+from layout_logic import LAYOUT_CONFIG, LAYOUT_STRATEGY
+from document_logic import DecodedDocument
+from uid_store_logic import MemoryUIDStore
+from ocr_logic import get_ocr_backend
+from metrics_logic import record_aadhaar_winner, record_ocr_call, run_in_context
 
 # --- 1. THE VERHOEFF ALGORITHM (For Mathematical Validation) ---
 class VerhoeffValidator:
@@ -32,135 +39,282 @@ class VerhoeffValidator:
         ]
         self.inv = [0, 4, 3, 2, 1, 5, 6, 7, 8, 9]
 
+        # Combined table: step[pos][c][n] = d[c][p[pos % 8][n]]. Position
+        # 12 of an Aadhaar number wraps to p[4], so 8 rows cover every step.
+        self.step = np.array(
+            [[[self.d[c][self.p[pos][n]] for n in range(10)] for c in range(10)] for pos in range(8)],
+            dtype=np.uint8
+        )
+        # Flattened copy for the scalar path: index pos*100 + c*10 + n
+        self._step_flat = tuple(int(v) for v in self.step.ravel())
+
     def validate(self, number_str):
-        if not number_str.isdigit() or len(number_str) != 12:
+        if len(number_str) != 12 or not number_str.isascii() or not number_str.isdigit():
             return False
+        step = self._step_flat
         c = 0
-        reversed_num = map(int, reversed(number_str))
-        for i, n in enumerate(reversed_num):
-            c = self.d[c][self.p[i % 8][n]]
+        for i, ch in enumerate(reversed(number_str)):
+            c = step[(i & 7) * 100 + c * 10 + (ord(ch) - 48)]
+        return c == 0
+
+    def validate_digits(self, digits):
+        # digits: (N, 12) array of 0-9, most significant digit first.
+        # Returns a boolean mask; one table gather per position, not per row.
+        digits = np.asarray(digits, dtype=np.intp)
+        c = np.zeros(digits.shape[0], dtype=np.intp)
+        for i in range(12):
+            c = self.step[i & 7, c, digits[:, 11 - i]]
         return c == 0
 
-# --- 2. SECURITY LAYER (Mock Database) ---
+    def validate_ids(self, ids):
+        # ids: array of 12-digit integers (e.g. a column of an ID export).
+        # Agrees with validate() on the zero-padded strings, so an ID with
+        # leading zeros is checked like any other; negatives mark malformed
+        # rows and are never valid.
+        ids = np.asarray(ids, dtype=np.int64)
+        in_range = (ids >= 0) & (ids <= 999999999999)
+        remaining = ids.copy()
+        c = np.zeros(ids.shape[0], dtype=np.intp)
+        for i in range(12):
+            # Peeling off the last digit walks the number right-to-left
+            remaining, n = np.divmod(remaining, 10)
+            c = self.step[i & 7, c, n]
+        return in_range & (c == 0)
+
+    def valid_windows(self, digit_str):
+        # Start offsets of every Verhoeff-valid 12-digit window in digit_str
+        if len(digit_str) < 12:
+            return np.empty(0, dtype=np.intp)
+        digits = np.frombuffer(digit_str.encode('ascii'), dtype=np.uint8) - 48
+        windows = np.lib.stride_tricks.sliding_window_view(digits, 12)
+        return np.flatnonzero(self.validate_digits(windows))
+
+# --- 2. SECURITY LAYER (Authorized UID Store) ---
+# Without a store, a small seeded mock database is built in memory. In
+# production pass a file-backed store from uid_store_logic.open_uid_store.
 class SecurityLayer:
-    def __init__(self):
-        self.authorized_db = set()
-        self._load_database()
+    def __init__(self, store=None):
+        if store is None:
+            store = MemoryUIDStore()
+            self._load_database(store)
+        self.store = store
 
-    def _load_database(self):
+    def _load_database(self, store):
         # 1. Specific IDs
-        self.authorized_db.add("779868767875")
-        self.authorized_db.add("800429588109")
+        store.add(779868767875)
+        store.add(800429588109)
 
         # 2. Mock Data
         random.seed(42) # Deterministic for consistent testing
-        while len(self.authorized_db) < 100:
-            dummy_id = str(random.randint(100000000000, 999999999999))
-            self.authorized_db.add(dummy_id)
+        while len(store) < 100:
+            store.add(random.randint(100000000000, 999999999999))
 
     def verify_uid(self, uid):
         clean_uid = uid.replace(" ", "").strip()
-        if clean_uid in self.authorized_db:
+        if len(clean_uid) == 12 and clean_uid.isdigit() and self.store.contains(int(clean_uid)):
              return True, "✅ PASS: ID found in authorized database."
         else:
              return False, "❌ FAIL: ID not found in database."
 
 # --- 3. AADHAAR OCR PROCESSOR ---
 class AadhaarAnalyzer:
-    def __init__(self):
+    # Preprocessing strategies, in the order they are tried
+    STRATEGIES = [
+        "Otsu Threshold",
+        "Adaptive Threshold",
+        "Grayscale Only",
+        "Original"
+    ]
+
+    # psm 6 = Assume a single uniform block of text.
+    # psm 3 = Fully automatic page segmentation, but no OSD. (Default)
+    # psm 11 = Sparse text. Find as much text as possible in no particular order.
+    # We try PSM 6 first (Block of text) then PSM 11 (Sparse)
+    CONFIGS = [r'--oem 3 --psm 6', r'--oem 3 --psm 11']
+
+    # Region-of-interest pass: the number is printed as one line of digit
+    # groups, so candidate lines are cropped and read as a single line
+    # (psm 7) with a digit whitelist before any full-card OCR is tried.
+    ROI_STRATEGY = "ROI Line"
+    ROI_CONFIG = r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789'
+    ROI_MAX_LINES = 4
+    ROI_LINE_HEIGHT = 48  # crops are resized to this height before OCR
+
+    # Reported as the winner when an embedded text layer held the number
+    TEXT_LAYER_STRATEGY = "Text Layer"
+
+    def __init__(self, parallel=False, max_workers=4, uid_store=None, ocr=None, roi=True):
         self.validator = VerhoeffValidator()
-        self.security = SecurityLayer()
+        self.security = SecurityLayer(uid_store)
+        self.ocr = ocr if ocr is not None else get_ocr_backend()
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self.roi = roi
 
     def get_text_from_image(self, img, config):
-        return pytesseract.image_to_string(img, config=config)
+        return self.ocr.image_to_string(img, config)
+
+    def preprocess(self, pipeline, strategy):
+        # All strategies share the pipeline's single OCR-scaled copy, which
+        # is only upscaled when the card's print is small
+        if strategy == "Otsu Threshold":
+            return pipeline.ocr_otsu
+        elif strategy == "Adaptive Threshold":
+            return pipeline.ocr_adaptive
+        elif strategy == "Grayscale Only":
+            return pipeline.ocr_gray
+        return pipeline.ocr_color
+
+    def find_number(self, text):
+        # Returns (match, ocr_text) or (None, "")
+
+        # Regex 1: Standard xxxx xxxx xxxx
+        match = re.search(r'\b\d{4}\s\d{4}\s\d{4}\b', text)
+        if not match:
+            # Regex 2: Compact xxxxxxxxxxxx
+            match = re.search(r'\b\d{12}\b', text)
+        if match:
+            return match.group(0), text
+
+        # Regex 3: Flexible spaces/newlines (Catch cases like 1234\n5678\n9012)
+        # Clean text first
+        cleaned = re.sub(r'[^0-9]', '', text)
+        # Check every 12 digit window for a valid Verhoeff in one batch
+        hits = self.validator.valid_windows(cleaned)
+        if len(hits):
+            # Found a structurally valid number!
+            candidate = cleaned[hits[0]:hits[0] + 12]
+            return candidate, f"Found via deep scan: {candidate}"
+        return None, ""
+
+    def _ocr_attempt(self, strategy, processed, config):
+        record_ocr_call("aadhaar", strategy, config)
+        return self.find_number(self.get_text_from_image(processed, config))
+
+    def candidate_lines(self, pipeline):
+        # Lines shaped like "xxxx xxxx xxxx": wide, and not so short that
+        # they are stray marks. The number is usually the largest print on
+        # the card, so the tallest lines go first.
+        image_h, image_w = pipeline.gray.shape
+        candidates = [
+            (x, y, w, h) for x, y, w, h in pipeline.text_lines
+            if 4 <= w / h <= 25 and h >= 0.015 * image_h and w >= 0.15 * image_w
+        ]
+        candidates.sort(key=lambda b: b[3], reverse=True)
+        return candidates[:self.ROI_MAX_LINES]
+
+    def crop_line(self, pipeline, box):
+        x, y, w, h = box
+        gray = pipeline.gray
+        pad = max(2, h // 4)
+        crop = gray[max(0, y - pad):y + h + pad, max(0, x - pad):x + w + pad]
+        scale = self.ROI_LINE_HEIGHT / h
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=interpolation)
+        return otsu_threshold(crop)
+
+    def _search_roi(self, pipeline):
+        # Only a checksum-valid read is accepted here; anything else falls
+        # through to the full-card strategies.
+        for box in self.candidate_lines(pipeline):
+            found_match, ocr_text = self._ocr_attempt(
+                self.ROI_STRATEGY, self.crop_line(pipeline, box), self.ROI_CONFIG)
+            if found_match and self.validator.validate(re.sub(r'\s', '', found_match)):
+                return found_match, ocr_text, (self.ROI_STRATEGY, self.ROI_CONFIG)
+        return None, "", None
 
-    def analyze(self, image_path):
+    def fallback_attempts(self):
+        # The full-card search starts from the document's shared OCR layout
+        # (Otsu, psm 6), so that pair is not OCR'd again afterwards
+        return [
+            (strategy, config) for strategy in self.STRATEGIES for config in self.CONFIGS
+            if (strategy, config) != (LAYOUT_STRATEGY, LAYOUT_CONFIG)
+        ]
+
+    def _search_layout(self, pipeline):
+        found_match, ocr_text = self.find_number(pipeline.layout_for(self.ocr).text)
+        if found_match:
+            return found_match, ocr_text, (LAYOUT_STRATEGY, LAYOUT_CONFIG)
+        return None, "", None
+
+    def _search_sequential(self, pipeline):
+        # Returns (match, ocr_text, (strategy, config) of the winner)
+        for strategy, config in self.fallback_attempts():
+            processed = self.preprocess(pipeline, strategy)
+            found_match, ocr_text = self._ocr_attempt(strategy, processed, config)
+            if found_match:
+                return found_match, ocr_text, (strategy, config)
+        return None, "", None
+
+    def _search_parallel(self, pipeline):
+        # Race every strategy/config pair on a pool of at most one worker
+        # per CPU. Results are collected in the sequential priority order,
+        # so the winner is the same one the sequential loop would pick; once
+        # it is known, attempts that have not started are cancelled and the
+        # running ones (at most one per worker) are waited for, so no OCR
+        # keeps burning CPU after the request has returned.
+        processed = {s: self.preprocess(pipeline, s) for s in self.STRATEGIES}
+        attempts = self.fallback_attempts()
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, os.cpu_count() or 1))
+        try:
+            futures = [
+                run_in_context(executor, self._ocr_attempt, strategy, processed[strategy], config)
+                for strategy, config in attempts
+            ]
+            for attempt, future in zip(attempts, futures):
+                found_match, ocr_text = future.result()
+                if found_match:
+                    return found_match, ocr_text, attempt
+            return None, "", None
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def analyze(self, image_path, parallel=None, pipeline=None, data=None, text=None):
+        # text: an embedded text layer (e.g. from a PDF page), searched
+        # before any OCR is run
         report = {
             "status": "Unknown",
             "details": "",
             "number_found": None,
             "verhoeff_valid": False,
-            "db_valid": False
+            "db_valid": False,
+            "ocr_strategy": None,
+            "ocr_config": None
         }
 
-        try:
-            # 1. Load Original Image
-            original_img = cv2.imread(image_path)
-            if original_img is None:
-                raise ValueError("Could not load image file.")
-
-            # List of preprocessing strategies to try
-            # Strategy: [Resize, Color, ThresholdConfig]
-            ocr_text = ""
-            strategies = [
-                "Otsu Threshold", 
-                "Adaptive Threshold", 
-                "Grayscale Only", 
-                "Original"
-            ]
-
-            found_match = None
+        if parallel is None:
+            parallel = self.parallel
 
-            for strategy in strategies:
-                img_copy = original_img.copy()
+        try:
+            # 1. An embedded text layer needs no OCR at all
+            found_match, ocr_text, winner = None, "", None
+            if text:
+                found_match, ocr_text = self.find_number(text)
+                if found_match:
+                    winner = (self.TEXT_LAYER_STRATEGY, "")
 
-                # Basic Preprocessing: Resize (Upscale) for better OCR
-                img_copy = cv2.resize(img_copy, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-                gray = cv2.cvtColor(img_copy, cv2.COLOR_BGR2GRAY)
+            # 2. Load Original Image (or reuse the caller's document/pipeline)
+            if not found_match and pipeline is None:
+                pipeline = DecodedDocument.load(image_path, data).pipeline
 
-                if strategy == "Otsu Threshold":
-                   processed = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-                elif strategy == "Adaptive Threshold":
-                   processed = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-                elif strategy == "Grayscale Only":
-                   processed = gray
+            # 3. Read candidate number lines, then the shared full-card
+            #    layout, then the other preprocessing strategies x
+            #    Tesseract configs
+            if not found_match and self.roi:
+                found_match, ocr_text, winner = self._search_roi(pipeline)
+            if not found_match:
+                found_match, ocr_text, winner = self._search_layout(pipeline)
+            if not found_match:
+                # With a single CPU the race only interleaves the attempts
+                if parallel and (os.cpu_count() or 1) > 1:
+                    found_match, ocr_text, winner = self._search_parallel(pipeline)
                 else:
-                   processed = img_copy
+                    found_match, ocr_text, winner = self._search_sequential(pipeline)
+
+            if winner:
+                report["ocr_strategy"], report["ocr_config"] = winner
+                record_aadhaar_winner(*winner)
 
-                # OCR Extraction
-                # psm 6 = Assume a single uniform block of text.
-                # psm 3 = Fully automatic page segmentation, but no OSD. (Default)
-                # psm 11 = Sparse text. Find as much text as possible in no particular order.
-                
-                # We try PSM 6 first (Block of text) then PSM 11 (Sparse)
-                configs = [r'--oem 3 --psm 6', r'--oem 3 --psm 11']
-                
-                for config in configs:
-                    text = self.get_text_from_image(processed, config)
-                    
-                    # Debug print
-                    # print(f"Strategy: {strategy} | Config: {config} | Found: {text[:20]}...")
-
-                    # Regex 1: Standard xxxx xxxx xxxx
-                    match = re.search(r'\b\d{4}\s\d{4}\s\d{4}\b', text)
-                    if not match:
-                        # Regex 2: Compact xxxxxxxxxxxx
-                        match = re.search(r'\b\d{12}\b', text)
-                    if not match:
-                         # Regex 3: Flexible spaces/newlines (Catch cases like 1234\n5678\n9012)
-                         # Clean text first
-                         cleaned = re.sub(r'[^0-9]', '', text)
-                         # Look for 12 digit sequence in clean text
-                         if len(cleaned) >= 12:
-                             # Scan through cleaned text for valid Verhoeff
-                             for i in range(len(cleaned) - 11):
-                                 candidate = cleaned[i:i+12]
-                                 if self.validator.validate(candidate):
-                                     # Found a structurally valid number!
-                                     found_match = candidate
-                                     ocr_text = f"Found via deep scan: {candidate}"
-                                     break
-                    
-                    if match:
-                        found_match = match.group(0)
-                        ocr_text = text
-                    
-                    if found_match:
-                        break # Break Config Loop
-                
-                if found_match:
-                    break # Break Strategy Loop
-            
             if found_match:
                 # Normalize format
                 raw_number = found_match
@@ -0,0 +1,385 @@
+import hashlib
+import os
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from backend_logic import ForgeryDetector
+from aadhaar_logic import AadhaarAnalyzer
+from certificate_logic import register_certificate
+from document_logic import DecodedDocument
+from fingerprint_logic import fingerprint, open_fingerprint_index
+from metadata_logic import analyze_metadata, analyze_pdf_metadata
+from pdf_logic import PDF_DPI, PDF_MAX_PAGES, is_pdf, open_pdf
+from uid_store_logic import open_uid_store
+from metrics_logic import run_in_context, stage
+
+# Bump whenever a change to the engines alters analysis results, so cached
+# results from the previous version are not served.
+ENGINE_VERSION = "12"
+
+# --- Per-process engines ---
+# Built on first use so that every process (gunicorn worker, job pool
+# worker) loads the engines' state once and then reuses it.
+_aadhaar_engine = None
+
+def get_aadhaar_engine():
+    global _aadhaar_engine
+    if _aadhaar_engine is None:
+        # Set AADHAAR_PARALLEL_OCR=1 to race the OCR strategies on a thread pool.
+        # AADHAAR_ROI_OCR=0 skips the number-line pass and OCRs the full card.
+        # UID_STORE points at a .u64 or .sqlite store built by uid_store_logic;
+        # without it the built-in mock database is used.
+        uid_store_path = os.environ.get("UID_STORE")
+        _aadhaar_engine = AadhaarAnalyzer(
+            parallel=os.environ.get("AADHAAR_PARALLEL_OCR", "0") == "1",
+            max_workers=int(os.environ.get("AADHAAR_OCR_WORKERS", "4")),
+            roi=os.environ.get("AADHAAR_ROI_OCR", "1") == "1",
+            uid_store=open_uid_store(uid_store_path) if uid_store_path else None
+        )
+    return _aadhaar_engine
+
+_fingerprint_index = None
+_fingerprint_index_opened = False
+
+def get_fingerprint_index():
+    # None when FINGERPRINT_INDEX is set empty
+    global _fingerprint_index, _fingerprint_index_opened
+    if not _fingerprint_index_opened:
+        _fingerprint_index = open_fingerprint_index()
+        _fingerprint_index_opened = True
+    return _fingerprint_index
+
+# --- Upload I/O ---
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def read_and_hash(stream, buffer_size=HASH_BUFFER_SIZE):
+    # Single pass over the stream: returns (bytes, sha256 hexdigest)
+    sha256_hash = hashlib.sha256()
+    chunks = []
+    for block in iter(lambda: stream.read(buffer_size), b""):
+        sha256_hash.update(block)
+        chunks.append(block)
+    return b"".join(chunks), sha256_hash.hexdigest()
+
+# --- Check scheduling ---
+# Checks run cheapest first: header metadata, JPEG compression history,
+# then ELA, then OCR. The policy decides whether the later ones still run:
+#   full         - every stage runs
+#   stop_on_fail - stop after the first stage that reports a Fail
+#   fast         - stop_on_fail, and expensive stages (OCR) only run when
+#                  the cheap ones left some doubt (a non-Pass check)
+# Set per request or with ANALYSIS_POLICY (default full).
+POLICIES = ("full", "stop_on_fail", "fast")
+
+def resolve_policy(policy=None):
+    policy = policy or os.environ.get("ANALYSIS_POLICY", "full")
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy '{policy}'. Use one of: {', '.join(POLICIES)}")
+    return policy
+
+def marksheet_stages(detector, upload_dir, text=None, metadata=None):
+    # (stage name, callable, check keys it writes, expensive). With a text
+    # layer the logic check needs no OCR and is no longer expensive.
+    stages = [("metadata", lambda: detector.check_metadata(metadata), ["Metadata"], False)]
+    # JPEG uploads first get the compression-history check, which reads the
+    # file's own tables and coefficients instead of re-encoding it.
+    # ELA_MODE=global skips the per-block ELA scoring; ELA_MODE=compression
+    # drops ELA for JPEG uploads and relies on the compression check alone.
+    ela_mode = os.environ.get("ELA_MODE", "tiled")
+    if detector.document.is_jpeg:
+        stages.append(("compression", detector.check_compression, ["Compression"], False))
+    if not (ela_mode == "compression" and detector.document.is_jpeg):
+        stages.append(("ela", lambda: detector.perform_ela(output_dir=upload_dir), ["ELA"], False))
+        if ela_mode != "global":
+            stages.append(("ela_tiles", detector.perform_tiled_ela, ["Localized ELA"], False))
+    # COPY_MOVE=0 skips the cloned-region search
+    if os.environ.get("COPY_MOVE", "1") != "0":
+        stages.append(("copy_move", detector.detect_copy_move, ["Copy-Move"], False))
+    if text is None:
+        stages.append(("logic_ocr", detector.verify_logical_consistency, ["Logic"], True))
+    else:
+        stages.append(("logic_text", lambda: detector.verify_logical_consistency(text), ["Logic"], False))
+    return stages
+
+def run_stages(stages, checks, policy=None):
+    policy = resolve_policy(policy)
+    ran, skipped = [], []
+    stop_reason = None
+    for name, run, check_keys, expensive in stages:
+        reason = stop_reason
+        if reason is None and policy == "fast" and expensive:
+            if all(c.get("status") == "Pass" for c in checks.values()):
+                reason = "earlier checks passed (fast mode)"
+        if reason:
+            skipped.append({"stage": name, "reason": reason})
+            continue
+
+        with stage(name):
+            run()
+        ran.append(name)
+        if policy != "full" and any(checks.get(k, {}).get("status") == "Fail" for k in check_keys):
+            stop_reason = f"{name} reported a Fail"
+    return {"policy": policy, "ran": ran, "skipped": skipped}
+
+# --- Analysis ---
+def analyze_file(filepath, display_name, doc_type, upload_dir="uploads", data=None, policy=None):
+    # With data, filepath only names the document and need not exist.
+    # policy only affects marksheets; see run_stages.
+    if data is None and filepath.lower().endswith(".pdf"):
+        with open(filepath, "rb") as f:
+            data = f.read()
+    if data is not None and is_pdf(data):
+        return analyze_pdf(filepath, display_name, doc_type, upload_dir, data, policy)
+
+    with stage("decode"):
+        document = DecodedDocument.load(filepath, data)
+    return analyze_document(document, display_name, doc_type, upload_dir, policy)
+
+def analyze_document(document, display_name, doc_type, upload_dir="uploads", policy=None,
+                     text=None, metadata=None):
+    # One decoded image: an upload or a PDF page. text (an embedded text
+    # layer) and metadata (a precomputed metadata result) stand in for OCR
+    # and header parsing when the caller already has them.
+    with stage("fingerprint"):
+        fp = fingerprint(document.pipeline.gray)
+
+    if doc_type == 'aadhaar':
+        with stage("aadhaar_ocr"):
+            result = get_aadhaar_engine().analyze(document, text=text)
+
+        return {
+            "filename": display_name,
+            "fingerprint": fp,
+            "checks": {
+                "Aadhaar Number": {
+                    "status": result["status"],
+                    "details": result["details"]
+                },
+                "Structural Check": {
+                    "status": "Pass" if result["verhoeff_valid"] else "Fail",
+                    "details": "Verhoeff Algorithm Validation"
+                },
+                "Database Check": {
+                    "status": "Pass" if result["db_valid"] else "Fail",
+                    "details": "ID existence in authorized DB"
+                }
+            },
+            "ela_url": None
+        }
+
+    detector = ForgeryDetector(document)
+    if doc_type == 'bills':
+        if metadata is None:
+            with stage("metadata"):
+                metadata = analyze_metadata(document.data)
+        with stage("ela"):
+            detector.perform_ela(output_dir=upload_dir)
+        with stage("tax_ocr" if text is None else "tax_text"):
+            detector.verify_tax_calculation(text)
+        return dict(bills_report(display_name, metadata, detector.report_data), fingerprint=fp)
+
+    report = detector.report_data
+    report["fingerprint"] = fp
+    stages = marksheet_stages(detector, upload_dir, text, metadata)
+    report["pipeline"] = run_stages(stages, report["checks"], policy)
+    return report
+
+def bills_report(display_name, metadata, detector_report):
+    checks = detector_report["checks"]
+    return {
+        "filename": display_name,
+        "checks": {
+            "ELA": checks["ELA"],
+            "Metadata Analysis": {
+                "status": metadata["status"],
+                "details": metadata["details"],
+                "software": metadata["software"]
+            },
+            "Tax Calculation": checks["Tax Calculation"]
+        },
+        "ela_path": detector_report.get("ela_path"),
+        "ela_url": None
+    }
+
+# Worst status wins when summarizing a document's checks
+STATUS_RANK = {"Pass": 0, "Warn": 1, "Error": 2, "Fail": 3}
+
+def overall_status(checks):
+    statuses = [c.get("status") for c in checks.values()]
+    if not statuses:
+        return "Unknown"
+    return max(statuses, key=lambda s: STATUS_RANK.get(s, 1))
+
+# --- PDF documents ---
+# Pages come out of the PDF library one at a time on the calling thread
+# (the libraries are not thread-safe) and are analyzed on a small thread
+# pool; OpenCV, NumPy and tesserocr release the GIL. At most two pages per
+# worker are held in memory. PDF_PAGE_WORKERS sizes the pool.
+def analyze_pdf(filepath, display_name, doc_type, upload_dir, data, policy=None):
+    with stage("pdf_open"):
+        source = open_pdf(data)
+    try:
+        with stage("metadata"):
+            metadata = analyze_pdf_metadata(source.metadata)
+
+        workers = int(os.environ.get("PDF_PAGE_WORKERS", "4"))
+        stem = os.path.splitext(os.path.basename(filepath))[0]
+        pages = source.pages(PDF_DPI, DecodedDocument.MAX_PIXELS, PDF_MAX_PAGES)
+        futures, in_flight = [], set()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                with stage("pdf_render"):
+                    page = next(pages, None)
+                if page is None:
+                    break
+                future = run_in_context(executor, analyze_pdf_page, page, f"{stem}_page{page.number}.png",
+                                        doc_type, upload_dir, policy, metadata)
+                futures.append(future)
+                in_flight.add(future)
+                if len(in_flight) >= 2 * workers:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            page_reports = [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=True)
+    finally:
+        source.close()
+
+    return aggregate_pages(display_name, doc_type, page_reports, source.page_count)
+
+def analyze_pdf_page(page, name, doc_type, upload_dir, policy, metadata):
+    if page.image_data is not None:
+        # A scanned page: analyze the embedded image itself. Its own
+        # headers are checked unless the PDF's already look suspicious.
+        document = DecodedDocument(page.image_data, name)
+        if metadata["status"] == "Pass":
+            metadata = None
+    else:
+        document = DecodedDocument(b"", name, bgr=page.bgr)
+    page.bgr = None
+
+    report = analyze_document(document, name, doc_type, upload_dir, policy, page.text or None, metadata)
+    report["page"] = page.number
+    report["source"] = page.source
+    report["text_layer"] = bool(page.text)
+    return report
+
+def aggregate_pages(display_name, doc_type, page_reports, page_count):
+    # Marksheets and bills keep the worst result of each check across
+    # pages: one edited page is enough. An Aadhaar PDF is judged by its
+    # best page, since only one side of the card carries the number.
+    if not page_reports:
+        raise ValueError("The PDF has no pages.")
+
+    if doc_type == 'aadhaar':
+        best = min(page_reports, key=lambda r: (
+            STATUS_RANK.get(r["checks"]["Aadhaar Number"]["status"], 1),
+            STATUS_RANK.get(overall_status(r["checks"]), 1)
+        ))
+        checks = {
+            key: dict(check, details=f"Page {best['page']}: {check['details']}", page=best["page"])
+            for key, check in best["checks"].items()
+        }
+    else:
+        checks = {}
+        for report in page_reports:
+            for key, check in report["checks"].items():
+                current = checks.get(key)
+                if current is None or STATUS_RANK.get(check["status"], 1) > STATUS_RANK.get(current["status"], 1):
+                    checks[key] = dict(check, details=f"Page {report['page']}: {check['details']}", page=report["page"])
+
+    # Show the ELA of the page that did worst on it
+    ela_page = checks.get("ELA", {}).get("page")
+    ela_path = next((r.get("ela_path") for r in page_reports if r["page"] == ela_page), None)
+
+    return {
+        "filename": display_name,
+        "page_count": page_count,
+        "pages_analyzed": len(page_reports),
+        "checks": checks,
+        "pages": [
+            {
+                "page": r["page"],
+                "source": r["source"],
+                "text_layer": r["text_layer"],
+                "status": overall_status(r["checks"]),
+                "checks": r["checks"],
+                "pipeline": r.get("pipeline")
+            }
+            for r in page_reports
+        ],
+        "ela_path": ela_path,
+        "ela_url": None,
+        # A PDF is fingerprinted by its first page
+        "fingerprint": page_reports[0].get("fingerprint")
+    }
+
+# --- Near-duplicate submissions ---
+def check_prior_submissions(report, doc_type, file_hash, index=None):
+    # Looks the document's fingerprint up among earlier submissions of the
+    # same document type, then records it. Reused templates with edited
+    # fields show up as near-identical documents with different bytes.
+    # An index that cannot be opened or is locked only downgrades this
+    # check to Warn; the rest of the report stands.
+    fp = report.get("fingerprint")
+    if fp is None:
+        return
+    try:
+        index = index if index is not None else get_fingerprint_index()
+        if index is None:
+            return
+        with stage("near_duplicates"):
+            count, closest = index.near(doc_type, fp, exclude_hash=file_hash)
+            index.add(doc_type, file_hash, fp)
+    except (sqlite3.Error, OSError) as e:
+        report["checks"]["Prior Submissions"] = {
+            "status": "Warn",
+            "details": f"Prior submissions could not be checked: {e}"
+        }
+        return
+
+    if count:
+        details = (f"{count} near-identical prior submission(s); the closest differs in "
+                   f"{closest[0][0]} of 64 hash bits. Possible template reuse.")
+    else:
+        details = "No near-identical prior submissions."
+    report["checks"]["Prior Submissions"] = {
+        "status": "Warn" if count else "Pass",
+        "details": details,
+        "count": count,
+        "matches": [
+            {"file_hash": h, "distance": d, "submitted": datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")}
+            for d, h, t in closest
+        ]
+    }
+
+def analyze_and_certify(filepath, display_name, doc_type, file_hash, base_url,
+                        upload_dir="uploads", cert_dir="certificates", data=None, policy=None):
+    # Full /analyze pipeline: checks, certificate and public URLs
+    cert_id = str(uuid.uuid4()).upper()
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    response_data = analyze_file(filepath, display_name, doc_type, upload_dir, data, policy)
+    check_prior_submissions(response_data, doc_type, file_hash)
+
+    if response_data.get("ela_path"):
+        response_data["ela_url"] = f"{base_url}/uploads/{response_data['ela_path']}"
+
+    # The PDF itself is rendered lazily; see certificate_logic
+    with stage("certificate"):
+        cert_filename = register_certificate(
+            cert_id, display_name, file_hash, doc_type.upper(), timestamp, cert_dir,
+            os.environ.get("CERT_RENDER_MODE", "lazy")
+        )
+
+    response_data["security"] = {
+        "file_hash": file_hash,
+        "cert_id": cert_id,
+        "cert_url": f"{base_url}/certificates/{cert_filename}"
+    }
+    return response_data
+
+def is_cacheable(response_data):
+    # Engine errors (e.g. Tesseract unavailable) are not worth replaying
+    return not any(c.get("status") == "Error" for c in response_data["checks"].values())
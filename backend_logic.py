@@ -1,110 +1,275 @@
 import cv2
 import numpy as np
-import pytesseract
-from PIL import Image, ImageChops, ImageEnhance, ExifTags
+from PIL import Image
+import io
 import os
-import re
 from datetime import datetime
+from document_logic import DecodedDocument
+from jpeg_logic import analyze_compression
+from layout_logic import Layout
+from metadata_logic import analyze_metadata
 
 class ForgeryDetector:
-    def __init__(self, file_path):
-        self.file_path = file_path
-        self.image = Image.open(file_path).convert('RGB')
-        self.cv_image = cv2.imread(file_path)
+    # ELA runs on at most this many pixels; larger images are area-downscaled
+    # first, which keeps the int16 difference buffers bounded.
+    ELA_MAX_PIXELS = 4_000_000
+
+    # Tiled ELA: blocks are multiples of the 8x8 JPEG grid, sized so the
+    # long side has about ELA_TILE_GRID blocks; a block is flagged when
+    # its robust z-score exceeds ELA_TILE_Z.
+    ELA_TILE_GRID = 64
+    ELA_TILE_Z = 4.0
+    # Calibrated on clean rendered and scanned pages (quality 75-90, 2x-4x
+    # scale): their outliers are isolated, at most 3 connected blocks, so
+    # a region needs ELA_TILE_MIN_BLOCKS. The spread is floored at
+    # ELA_TILE_MIN_MAD (real pages show 0.03-0.13): a page resaved at its
+    # own quality has near-zero error everywhere and no spread at all.
+    ELA_TILE_MIN_BLOCKS = 4
+    ELA_TILE_MIN_MAD = 0.03
+
+    # Copy-move: every COPY_MOVE_BLOCK-pixel window (stride 1) of the page,
+    # shrunk by a power of two to at most COPY_MOVE_MAX_PIXELS, is described
+    # by its lowest COPY_MOVE_COEFFS x COPY_MOVE_COEFFS DCT coefficients.
+    # Windows with equal quantized features are paired and vote for the
+    # shift between them. A shift is a cloned region when one connected
+    # group of at least COPY_MOVE_MIN_WINDOWS windows moved by it, covering
+    # COPY_MOVE_MIN_DENSITY of the textured windows in the group's box: a
+    # pasted patch matches almost everywhere, repeated print on a scan only
+    # in places. Pages with less background noise than COPY_MOVE_MIN_NOISE
+    # are digital renders, where repeated glyphs are pixel-exact copies, so
+    # they are not assessed.
+    # Matching is exact, so a clone must survive the last JPEG save: one
+    # moved along its 8-pixel grid does (and the power-of-two shrink keeps
+    # it so), one pasted off the grid, rescaled or rotated only matches in
+    # places and is usually missed. The smallest detectable clone of text
+    # is about 48 x 48 pixels at working scale: 96 x 96 in a 2-8 MP upload,
+    # 192 x 192 up to 32 MP.
+    COPY_MOVE_MAX_PIXELS = 2_000_000
+    COPY_MOVE_BLOCK = 16
+    COPY_MOVE_COEFFS = 4
+    COPY_MOVE_QUANT = 8.0
+    COPY_MOVE_QUANT_PER_NOISE = 6.0
+    COPY_MOVE_MIN_STD = 12.0  # flatter windows (blank paper) are skipped
+    COPY_MOVE_MIN_WINDOWS = 300
+    COPY_MOVE_MIN_DENSITY = 0.7
+    COPY_MOVE_MIN_NOISE = 0.25
+
+    # Text checks read the pipeline's shared OCR layout. Cells read below
+    # LOW_CONFIDENCE are named in a discrepancy's details.
+    LOW_CONFIDENCE = 60.0
+    TOTAL_LABEL = r'\btotal\b'
+
+    # Bills: labels are matched case-insensitively against whole lines
+    SUBTOTAL_LABEL = r'sub\s*-?\s*total|taxable|before\s+(?:tax|gst)'
+    TAX_LABEL = r'\b[csi]?gst\b'
+    BILL_TOTAL_LABEL = r'grand\s*total|total\s*amount|amount\s*payable|^\W*total\b'
+    GST_RATE = 18.0  # assumed when the bill prints no rate
+
+    def __init__(self, file_path, pipeline=None, data=None):
+        # file_path may be a path, a name for in-memory bytes passed as data,
+        # or an already DecodedDocument shared with other checks.
+        self.document = DecodedDocument.load(file_path, data)
+        self.file_path = file_path if isinstance(file_path, str) else self.document.name
+        self.pipeline = pipeline if pipeline is not None else self.document.pipeline
+        self.cv_image = self.document.bgr
         self.report_data = {
-            "filename": os.path.basename(file_path),
+            "filename": os.path.basename(self.file_path),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "checks": {},
             "ela_path": None
         }
+        self._ela_results = {}
+
+    @property
+    def image(self):
+        return self.document.pil
+
+    def compute_ela(self, quality=90):
+        # Global and tiled ELA share one recompression per quality
+        if quality not in self._ela_results:
+            self._ela_results[quality] = self._compute_ela(quality)
+        return self._ela_results[quality]
+
+    def _compute_ela(self, quality):
+        working = self.pipeline.fit(self.ELA_MAX_PIXELS)
+        if working is self.document.bgr:
+            rgb, image = self.document.rgb, self.image
+        else:
+            rgb = working[:, :, ::-1]
+            image = Image.fromarray(rgb)
 
-    def perform_ela(self, quality=90, output_dir="."):
-        temp_filename = "temp_ela_source.jpg"
-        self.image.save(temp_filename, 'JPEG', quality=quality)
-        temp_image = Image.open(temp_filename).convert('RGB')
-        ela_image = ImageChops.difference(self.image, temp_image)
-        
-        extrema = ela_image.getextrema()
-        max_diff = max([ex[1] for ex in extrema])
+        # Recompress into an in-memory buffer instead of a shared temp file,
+        # so parallel workers never touch the same path on disk.
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        buffer.seek(0)
+        recompressed = np.asarray(Image.open(buffer).convert('RGB'), dtype=np.int16)
+        original = rgb.astype(np.int16)
+
+        diff = np.abs(original - recompressed).astype(np.uint8)
+        max_diff = int(diff.max())
         scale = 255.0 / max_diff if max_diff > 0 else 1
-        ela_image = ImageEnhance.Brightness(ela_image).enhance(scale)
-        ela_np = np.array(ela_image)
-        std_dev = np.std(ela_np)
-        
+        ela_np = np.clip(diff * scale, 0, 255).astype(np.uint8)
+        std_dev = float(np.std(ela_np))
+        return std_dev, ela_np
+
+    def perform_ela(self, quality=90, output_dir=".", save_visual=True):
+        std_dev, ela_np = self.compute_ela(quality)
+
         # Heuristic threshold
-        is_suspect = std_dev > 14.0 
-        
-        ela_out_name = f"ela_{os.path.basename(self.file_path)}"
-        ela_out_path = os.path.join(output_dir, ela_out_name)
-        ela_image.save(ela_out_path)
-        self.report_data["ela_path"] = ela_out_name
-        
+        is_suspect = std_dev > 14.0
+
+        ela_out_path = None
+        if save_visual and output_dir is not None:
+            # Only encode the visualization when the caller wants it
+            ela_out_name = f"ela_{os.path.basename(self.file_path)}"
+            ela_out_path = os.path.join(output_dir, ela_out_name)
+            Image.fromarray(ela_np).save(ela_out_path)
+            self.report_data["ela_path"] = ela_out_name
+
         self.report_data["checks"]["ELA"] = {
             "status": "Fail" if is_suspect else "Pass",
             "details": f"ELA Std Dev: {std_dev:.2f}. High variance suggests modification.",
             "score": std_dev
         }
-        if os.path.exists(temp_filename): os.remove(temp_filename)
         return ela_out_path
 
-    def check_metadata(self):
-        suspicious_tags = ['Photoshop', 'GIMP', 'Editor', 'Adobe']
-        found_tags = []
-        try:
-            exif_data = self.image.getexif()
-            if exif_data:
-                for tag, value in exif_data.items():
-                    decoded = ExifTags.TAGS.get(tag, tag)
-                    val_str = str(value)
-                    for sus in suspicious_tags:
-                        if sus.lower() in val_str.lower():
-                            found_tags.append(f"{decoded}: {val_str}")
-        except:
-            pass
-            
+    def perform_tiled_ela(self, quality=90):
+        # A small edited field barely moves the global std, so the ELA image
+        # is also scored per block. Each block's mean error level is divided
+        # by its own contrast (text edges always recompress badly), then
+        # compared with the page's other content blocks by median/MAD.
+        _, ela_np = self.compute_ela(quality)
+        working = self.pipeline.fit(self.ELA_MAX_PIXELS)
+        gray = self.pipeline.gray if working is self.document.bgr else cv2.cvtColor(working, cv2.COLOR_BGR2GRAY)
+
+        block = max(16, 8 * -(-max(gray.shape) // (self.ELA_TILE_GRID * 8)))
+        z, content = tiled_ela_scores(ela_np, gray, block, min_mad=self.ELA_TILE_MIN_MAD)
+        flagged = content & (z > self.ELA_TILE_Z)
+
+        # Blocks -> upload coordinates
+        scale = self.document.original_size[0] / float(working.shape[1])
+        regions = flagged_regions(flagged, z, block * scale, self.ELA_TILE_MIN_BLOCKS)
+
+        heat = np.where(content, np.clip(z, 0, 2 * self.ELA_TILE_Z) / (2 * self.ELA_TILE_Z) * 255, 0)
+        max_z = float(z[content].max()) if content.any() else 0.0
+
+        if regions:
+            details = (f"{len(regions)} region(s) with outlying error levels (max z-score {max_z:.1f}); "
+                       "review manually, this does not prove an edit.")
+        else:
+            details = f"No localized error-level outliers in {int(content.sum())} content blocks."
+        self.report_data["checks"]["Localized ELA"] = {
+            "status": "Warn" if regions else "Pass",
+            "details": details,
+            "score": max_z,
+            "regions": regions,
+            "heatmap": {"block": round(block * scale, 2), "rows": heat.astype(np.uint8).tolist()}
+        }
+        return regions
+
+    def detect_copy_move(self):
+        # Finds regions that reappear elsewhere on the page, e.g. a mark
+        # copied from one row onto another. Sorting the feature hashes
+        # brings equal windows together, so matching is O(n log n) in
+        # the number of windows rather than pairwise.
+        gray = self.pipeline.reduced_gray(self.COPY_MOVE_MAX_PIXELS)
+        block = self.COPY_MOVE_BLOCK
+
+        variance = window_variance(gray, block)
+        noise = background_noise(variance, self.COPY_MOVE_MIN_STD)
+        regions = []
+        status = "Pass"
+        if noise < self.COPY_MOVE_MIN_NOISE:
+            # The check did not run, which must not read as clean
+            status = "Warn"
+            details = ("Not assessed: the page has no measurable background noise (digitally generated or heavily "
+                       "compressed), so repeated print matches itself exactly.")
+        else:
+            textured = variance > self.COPY_MOVE_MIN_STD ** 2
+            ys, xs = np.nonzero(textured)
+            features = block_dct_features(gray, block, self.COPY_MOVE_COEFFS, ys, xs)
+            # Coarser steps on grainier pages, so that noise does not split
+            # copies of the same content into different cells
+            step = max(self.COPY_MOVE_QUANT, self.COPY_MOVE_QUANT_PER_NOISE * noise)
+            quantized = np.round(features / step).astype(np.int16)
+            shifts = matching_shifts(quantized, ys, xs, 2 * block, self.COPY_MOVE_MIN_WINDOWS)
+
+            # Windows -> upload coordinates
+            factor = self.document.bgr.shape[1] // gray.shape[1]
+            scale = self.document.original_size[0] / float(self.document.bgr.shape[1]) * factor
+            for shift, src in shifts:
+                region = cloned_region(ys[src], xs[src], shift, textured, block, scale)
+                if region["windows"] >= self.COPY_MOVE_MIN_WINDOWS and region["density"] >= self.COPY_MOVE_MIN_DENSITY:
+                    regions.append(region)
+            if regions:
+                status = "Fail"
+                details = f"{len(regions)} region(s) duplicated elsewhere on the page (copy-move)."
+            else:
+                details = f"No duplicated regions among {len(ys)} textured blocks."
+
+        self.report_data["checks"]["Copy-Move"] = {
+            "status": status,
+            "details": details,
+            "noise": round(noise, 2),
+            "regions": regions
+        }
+        return regions
+
+    def check_metadata(self, result=None):
+        # Header-only: metadata segments are parsed from the raw bytes.
+        # result: a precomputed analysis (e.g. of a PDF's document info)
+        if result is None:
+            result = analyze_metadata(self.document.data)
         self.report_data["checks"]["Metadata"] = {
-            "status": "Fail" if found_tags else "Pass",
-            "details": f"Traces found: {', '.join(found_tags)}" if found_tags else "No editing software traces found."
+            "status": result["status"],
+            "details": result["details"],
+            "software": result["software"]
         }
 
-    def verify_logical_consistency(self):
-        # OCR logical check
-        gray = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2GRAY)
-        # Otsu thresholding
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
+    def check_compression(self):
+        # JPEG only: quantization tables and a luma-only decode, no
+        # re-encoding; see jpeg_logic
+        self.report_data["checks"]["Compression"] = analyze_compression(self.document.data, self.document.max_pixels)
+
+    def layout(self, text=None):
+        # text: an embedded text layer (e.g. from a PDF page) used in place
+        # of OCR; otherwise the pipeline's single OCR pass
+        return Layout.from_text(text) if text is not None else self.pipeline.layout
+
+    def verify_logical_consistency(self, text=None):
+        # Sum check over the numeric cells: subject marks (2-3 digit
+        # numbers) must add up to the number on the "Total" line, or, when
+        # no line is labelled, to the largest mark.
         try:
-            # PSM 6 assumes a single uniform block of text
-            custom_config = r'--oem 3 --psm 6'
-            text = pytesseract.image_to_string(thresh, config=custom_config)
-            
-            # Simple heuristic extraction of marks
-            # Look for 2 or 3 digit numbers
-            numbers = [int(s) for s in re.findall(r'\b\d{2,3}\b', text)]
-            
-            status = "Pass"
-            details = "Logic Verified."
-            
-            if len(numbers) >= 3:
-                numbers.sort()
-                total = numbers[-1]
-                subjects = numbers[:-1]
-                
-                # Check sum of subjects vs total
-                subset_sum = sum(subjects)
-                
-                # We can also check if subset_sum is close to total if we worry about OCR errors
-                # But strict check is better for forgery detection
+            layout = self.layout(text)
+            total_line, total_cell = layout.labelled_value(self.TOTAL_LABEL)
+            if total_cell is None:
+                # A "Total" line whose value is not a clean number
+                total_line = next((l for l in layout.find_lines(self.TOTAL_LABEL) if l.last_digits()), None)
+                total_cell = total_line.last_digits() if total_line else None
+            marks = [
+                w for line in layout.lines if line is not total_line for w in line.numbers
+                if not w.percent and w.value.is_integer() and 10 <= w.value <= 999
+            ]
+            if total_cell is None and len(marks) >= 3:
+                marks.sort(key=lambda w: w.value)
+                total_cell = marks.pop()
+
+            if total_cell is not None and len(marks) >= 2:
+                subset_sum = int(sum(w.value for w in marks))
+                total = int(total_cell.value)
                 if subset_sum == total:
                     status = "Pass"
                     details = f"Sum of marks ({subset_sum}) matches Total ({total})."
                 else:
                     status = "Fail"
                     details = f"Logical Discrepancy: Sum of subjects ({subset_sum}) != Total ({total})."
+                    details += self._low_confidence_note(marks + [total_cell])
             else:
                 status = "Warn"
-                details = f"Insufficient data for logic check. Found numbers: {numbers}"
-                
+                details = f"Insufficient data for logic check. Found numbers: {[int(w.value) for w in layout.numbers]}"
+
         except Exception as e:
             status = "Error"
             details = f"OCR process failed: {str(e)}"
@@ -113,3 +278,207 @@ class ForgeryDetector:
             "status": status,
             "details": details
         }
+
+    def verify_tax_calculation(self, text=None):
+        # Bills: the GST lines must be the stated rate (CGST + SGST, or
+        # IGST) of the taxable amount, and amount + tax must be the total.
+        try:
+            layout = self.layout(text)
+            # "Total GST" is a tax line; "Total (incl. GST)" is the total
+            excluded = layout.find_lines(self.SUBTOTAL_LABEL) + layout.find_lines(r'\bincl')
+            tax_lines = [line for line in layout.find_lines(self.TAX_LABEL) if line not in excluded]
+            _, subtotal = layout.labelled_value(self.SUBTOTAL_LABEL)
+            totals = [line for line in layout.find_lines(self.BILL_TOTAL_LABEL) if line not in tax_lines]
+            total = next((line.amount for line in totals if line.amount is not None), None)
+
+            taxes = [line.amount for line in tax_lines if line.amount is not None]
+            rates = [w.value for line in tax_lines for w in line.numbers if w.percent]
+            rate = sum(rates) if rates else self.GST_RATE
+            tax = sum(w.value for w in taxes)
+            cells = taxes + [c for c in (subtotal, total) if c is not None]
+
+            if not taxes or (subtotal is None and total is None):
+                status = "Warn"
+                details = "Insufficient data for tax check: no taxable amount, GST and total found."
+            else:
+                base = subtotal.value if subtotal is not None else total.value - tax
+                expected = round(base * rate / 100, 2)
+                problems = []
+                # Each printed tax line may be rounded to the rupee
+                if abs(tax - expected) > 0.5 * len(taxes) + 0.01:
+                    problems.append(f"GST {rate:g}% of {base:,.2f} is {expected:,.2f}, but the bill charges {tax:,.2f}")
+                if subtotal is not None and total is not None and abs(base + tax - total.value) > 1.0:
+                    problems.append(f"{base:,.2f} + {tax:,.2f} GST != Total ({total.value:,.2f})")
+                if problems:
+                    status = "Fail"
+                    details = "Tax Discrepancy: " + "; ".join(problems) + "."
+                    details += self._low_confidence_note(cells)
+                else:
+                    status = "Pass"
+                    details = f"GST {rate:g}% calculation is mathematically correct ({base:,.2f} + {tax:,.2f})."
+
+        except Exception as e:
+            status = "Error"
+            details = f"OCR process failed: {str(e)}"
+
+        self.report_data["checks"]["Tax Calculation"] = {
+            "status": status,
+            "details": details
+        }
+
+    def _low_confidence_note(self, cells):
+        # Strict checks still Fail on a mismatch, but say when a number
+        # behind it may be an OCR misread
+        doubtful = [w.text for w in cells if w.conf < self.LOW_CONFIDENCE]
+        return f" Low OCR confidence on: {', '.join(doubtful)}." if doubtful else ""
+
+def _blocks(image, block):
+    # (rows, block, cols, block, ...) view over the whole blocks of image
+    rows, cols = image.shape[0] // block, image.shape[1] // block
+    cropped = image[:rows * block, :cols * block]
+    return cropped.reshape((rows, block, cols, block) + image.shape[2:])
+
+def tiled_ela_scores(ela_np, gray, block, min_contrast=8.0, min_mad=0.03):
+    # Returns (z, content): robust z-scores of contrast-normalized block
+    # error levels, and the mask of blocks with enough contrast to judge
+    # (blank paper carries no ELA signal either way).
+    error = _blocks(ela_np, block).mean(axis=(1, 3, 4) if ela_np.ndim == 3 else (1, 3), dtype=np.float32)
+    contrast = _blocks(gray, block).std(axis=(1, 3), dtype=np.float32)
+    content = contrast > min_contrast
+
+    normalized = error / (contrast + min_contrast)
+    if not content.any():
+        return np.zeros_like(normalized), content
+    baseline = normalized[content]
+    median = np.median(baseline)
+    mad = 1.4826 * np.median(np.abs(baseline - median))
+    z = (normalized - median) / max(float(mad), min_mad)
+    return z, content
+
+def dct_basis(n):
+    # Orthonormal DCT-II matrix: row u is the u-th basis vector
+    x = np.arange(n)
+    basis = np.cos(np.pi * (2 * x[None, :] + 1) * np.arange(n)[:, None] / (2.0 * n)) * np.sqrt(2.0 / n)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+def window_variance(image, block):
+    # Variance of every block x block window, indexed by its top-left corner
+    rows, cols = image.shape[0] - block + 1, image.shape[1] - block + 1
+    image = image.astype(np.float32)
+    mean = cv2.boxFilter(image, cv2.CV_32F, (block, block), anchor=(0, 0), borderType=cv2.BORDER_CONSTANT)
+    mean_sq = cv2.sqrBoxFilter(image, cv2.CV_32F, (block, block), anchor=(0, 0), borderType=cv2.BORDER_CONSTANT)
+    return (mean_sq - mean * mean)[:max(rows, 0), :max(cols, 0)]
+
+def block_dct_features(gray, block, size, ys, xs):
+    # The size x size lowest-frequency DCT coefficients of the block x
+    # block windows at top-left corners (ys, xs), as an (n, size * size)
+    # array. The 2-D transform is separable, so each coefficient is two
+    # 1-D filters over the whole image (the vertical pass is shared),
+    # sampled at the windows; no window is transformed on its own.
+    image = gray.astype(np.float32)
+    basis = dct_basis(block)
+    flat = ys.astype(np.intp) * image.shape[1] + xs
+    features = np.empty((size * size, len(ys)), np.float32)
+    for u in range(size):
+        vertical = cv2.filter2D(image, cv2.CV_32F, basis[u].reshape(-1, 1), anchor=(0, 0),
+                                borderType=cv2.BORDER_CONSTANT)
+        for v in range(size):
+            response = cv2.filter2D(vertical, cv2.CV_32F, basis[v].reshape(1, -1), anchor=(0, 0),
+                                    borderType=cv2.BORDER_CONSTANT)
+            np.take(response.ravel(), flat, out=features[u * size + v])
+    return features.T
+
+def background_noise(variance, min_std):
+    # Typical pixel noise of the flat (paper) windows. Scans and photos
+    # show sensor and paper grain; digitally rendered pages are exactly flat.
+    flat = variance[variance < min_std * min_std]
+    if flat.size == 0:
+        return 0.0
+    return float(np.sqrt(max(float(np.median(flat)), 0.0)))
+
+def matching_shifts(quantized, ys, xs, min_shift, min_matches, neighbours=3, max_shifts=8):
+    # Pairs windows with identical quantized features and votes on the
+    # shift between them. Returns [((dy, dx), source window indices)],
+    # most supported shift first.
+    if len(quantized) < 2:
+        return []
+    # Each row of int16 features is packed into 64-bit words and hashed
+    # (wrapping arithmetic); hash-equal pairs are re-checked on the words
+    packed = np.ascontiguousarray(quantized, dtype=np.int16)
+    packed = np.pad(packed, ((0, 0), (0, -packed.shape[1] % 4))).view(np.uint64)
+    multipliers = (np.arange(1, packed.shape[1] + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+    hashes = (packed * multipliers).sum(axis=1, dtype=np.uint64)
+    # Stable: equal windows stay in raster order, so neighbours in a run
+    # are usually nearby repeats along a rule line, dropped by min_shift
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+
+    sources, targets = [], []
+    for offset in range(1, neighbours + 1):
+        same = sorted_hashes[offset:] == sorted_hashes[:-offset]
+        a, b = order[:-offset][same], order[offset:][same]
+        equal = (packed[a] == packed[b]).all(axis=1)
+        sources.append(a[equal])
+        targets.append(b[equal])
+    a, b = np.concatenate(sources), np.concatenate(targets)
+
+    # Orient every pair the same way so one clone gives one shift
+    dy, dx = ys[b] - ys[a], xs[b] - xs[a]
+    flip = (dy < 0) | ((dy == 0) & (dx < 0))
+    a = np.where(flip, b, a)
+    dy, dx = np.abs(dy), np.where(flip, -dx, dx)
+    far = dy * dy + dx * dx >= min_shift * min_shift
+    a, dy, dx = a[far], dy[far].astype(np.int64), dx[far].astype(np.int64)
+    if not len(a):
+        return []
+
+    span = int(xs.max()) + 1
+    keys, inverse, counts = np.unique(dy * (2 * span) + dx + span, return_inverse=True, return_counts=True)
+    winners = [i for i in np.argsort(counts)[::-1][:max_shifts] if counts[i] >= min_matches]
+    return [
+        ((int(keys[i] // (2 * span)), int(keys[i] % (2 * span) - span)), np.unique(a[inverse == i]))
+        for i in winners
+    ]
+
+def cloned_region(ys, xs, shift, textured, block, scale):
+    # Largest connected group of source windows for one shift -> source
+    # and target boxes in upload coordinates, its size in windows and the
+    # share of the textured windows within its box that it covers
+    mask = np.zeros(textured.shape, np.uint8)
+    mask[ys, xs] = 1
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    x, y, w, h, windows = (int(v) for v in stats[largest])
+    density = windows / float(max(int(textured[y:y + h, x:x + w].sum()), 1))
+    dy, dx = shift
+
+    def box(x, y):
+        # Window corners -> the pixels the windows cover
+        return {"x": int(x * scale), "y": int(y * scale),
+                "width": int((w + block - 1) * scale), "height": int((h + block - 1) * scale)}
+
+    return {
+        "source": box(x, y),
+        "target": box(x + dx, y + dy),
+        "shift": {"dx": int(dx * scale), "dy": int(dy * scale)},
+        "windows": windows,
+        "density": round(density, 2)
+    }
+
+def flagged_regions(flagged, z, block_size, min_blocks=1):
+    # Connected groups of at least min_blocks flagged blocks -> bounding
+    # boxes in pixels
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(flagged.astype(np.uint8), connectivity=8)
+    regions = []
+    for i in range(1, count):
+        if stats[i, cv2.CC_STAT_AREA] < min_blocks:
+            continue
+        x, y, w, h = stats[i, :4]
+        regions.append({
+            "x": int(x * block_size), "y": int(y * block_size),
+            "width": int(w * block_size), "height": int(h * block_size),
+            "score": round(float(z[labels == i].max()), 2)
+        })
+    regions.sort(key=lambda r: r["score"], reverse=True)
+    return regions
@@ -0,0 +1,229 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from analysis_logic import (POLICIES, analyze_file, check_prior_submissions, get_aadhaar_engine,
+                            overall_status, read_and_hash)
+
+DOCUMENT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp', '.pdf')
+
+# Zip bomb limits: an archive with more members, or whose documents would
+# inflate to more bytes, is rejected before anything is extracted
+ZIP_MAX_MEMBERS = int(os.environ.get("ZIP_MAX_MEMBERS", "1000"))
+ZIP_MAX_BYTES = int(os.environ.get("ZIP_MAX_MB", "1024")) * 1024 * 1024
+
+# --- Worker side ---
+def _init_worker():
+    # Load engine state (e.g. the SecurityLayer DB) once per process
+    get_aadhaar_engine()
+
+def analyze_one(path, name, doc_type, ela_dir=None, policy=None):
+    result = {"file": name, "doc_type": doc_type}
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            data, result["sha256"] = read_and_hash(f)
+
+        report = analyze_file(path, name, doc_type, ela_dir, data, policy)
+        check_prior_submissions(report, doc_type, result["sha256"])
+        result["status"] = overall_status(report["checks"])
+        result["checks"] = report["checks"]
+        if report.get("pipeline"):
+            result["pipeline"] = report["pipeline"]
+        if report.get("ela_path"):
+            result["ela_path"] = report["ela_path"]
+    except Exception as e:
+        result["status"] = "Error"
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+# --- Input discovery ---
+def extract_zip(zip_path, dest_dir, max_members=None, max_bytes=None):
+    # Flatten members into dest_dir; basenames only, so nothing escapes it.
+    # Raises ValueError for an unreadable or oversized archive. Declared
+    # sizes can be trusted: zipfile stops reading a member at its file_size.
+    max_members = ZIP_MAX_MEMBERS if max_members is None else max_members
+    max_bytes = ZIP_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise ValueError(f"{os.path.basename(zip_path)} is not a valid zip archive.")
+
+    items = []
+    with archive:
+        infos = archive.infolist()
+        if len(infos) > max_members:
+            raise ValueError(f"Archive has {len(infos)} members; at most {max_members} are accepted.")
+        documents = [
+            (i, info) for i, info in enumerate(infos)
+            if not info.is_dir() and os.path.basename(info.filename).lower().endswith(DOCUMENT_EXTENSIONS)
+        ]
+        total = sum(info.file_size for _, info in documents)
+        if total > max_bytes:
+            raise ValueError(f"Archive would extract to {total // (1024 * 1024)} MB; "
+                             f"at most {max_bytes // (1024 * 1024)} MB is accepted.")
+
+        for i, info in documents:
+            name = os.path.basename(info.filename)
+            target = os.path.join(dest_dir, f"{i}_{name}")
+            try:
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            except zipfile.BadZipFile as e:
+                # e.g. a member longer than its declared size fails its CRC
+                raise ValueError(f"{info.filename}: {e}")
+            items.append((target, info.filename))
+    return items
+
+def collect_inputs(paths, work_dir):
+    # Returns (path, display_name) pairs for files, directories and zips
+    items = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                        full = os.path.join(root, name)
+                        items.append((full, os.path.relpath(full, path)))
+        elif path.lower().endswith('.zip'):
+            items.extend(extract_zip(path, work_dir))
+        else:
+            items.append((path, os.path.basename(path)))
+    return items
+
+# --- Batch runner ---
+# Keeps one process pool alive (per gunicorn worker or CLI run) so the
+# engines are loaded once per pool process, not once per file.
+class BatchRunner:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def _reset_executor(self):
+        # A pool whose child died (e.g. OOM-killed) refuses all further work
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _submit(self, *args):
+        try:
+            return self._get_executor().submit(analyze_one, *args)
+        except BrokenProcessPool:
+            self._reset_executor()
+            return self._get_executor().submit(analyze_one, *args)
+
+    def run(self, items, doc_type, ela_dir=None, policy=None):
+        # Yields one result per file, in completion order. Only a few tasks
+        # per worker are in flight, so huge batches don't queue up at once.
+        # Files in flight when a worker process dies are reported as errors
+        # and the rest of the batch continues on a new pool.
+        max_in_flight = self.max_workers * 4
+        items = iter(items)
+        in_flight = {}
+
+        while True:
+            while len(in_flight) < max_in_flight:
+                item = next(items, None)
+                if item is None:
+                    break
+                path, name = item
+                in_flight[self._submit(path, name, doc_type, ela_dir, policy)] = name
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    self._reset_executor()
+                    yield {"file": name, "doc_type": doc_type, "status": "Error",
+                           "error": "The analysis worker process died (e.g. out of memory)."}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+class BatchSummary:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = {}
+        self.total = 0
+
+    def add(self, result):
+        self.total += 1
+        self.counts[result["status"]] = self.counts.get(result["status"], 0) + 1
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "total": self.total,
+            "by_status": self.counts,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(self.total / elapsed, 3) if elapsed > 0 else None
+        }
+
+def stream_ndjson(runner, items, doc_type, ela_dir=None, policy=None):
+    # NDJSON lines for each result, then a final {"summary": ...} line
+    summary = BatchSummary()
+    for result in runner.run(items, doc_type, ela_dir, policy):
+        summary.add(result)
+        yield json.dumps(result) + "\n"
+    yield json.dumps({"summary": summary.as_dict()}) + "\n"
+
+# --- Command line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk forensic verification of document images.")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or .zip archives")
+    parser.add_argument("--doc-type", default="marksheet", choices=["marksheet", "aadhaar", "bills"])
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default="-", help="NDJSON results file (default: stdout)")
+    parser.add_argument("--summary", default=None, help="Write the summary JSON here as well")
+    parser.add_argument("--ela-dir", default=None, help="Save ELA visualizations into this directory")
+    parser.add_argument("--policy", default=None, choices=POLICIES,
+                        help="Which checks run: full, stop_on_fail or fast (default: ANALYSIS_POLICY or full)")
+    args = parser.parse_args(argv)
+
+    if args.ela_dir:
+        os.makedirs(args.ela_dir, exist_ok=True)
+
+    work_dir = tempfile.mkdtemp(prefix="sicario_batch_")
+    runner = BatchRunner(args.workers)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        items = collect_inputs(args.inputs, work_dir)
+        summary = None
+        for line in stream_ndjson(runner, items, args.doc_type, args.ela_dir, args.policy):
+            out.write(line)
+            out.flush()
+            summary = json.loads(line).get("summary")
+        if args.summary:
+            with open(args.summary, "w") as f:
+                json.dump(summary, f, indent=2)
+        print(json.dumps(summary), file=sys.stderr)
+    finally:
+        runner.shutdown()
+        if out is not sys.stdout:
+            out.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+# --- Benchmark suite for the forensic pipelines ---
+# Generates synthetic marksheets, Aadhaar-like cards and tampered variants
+# at several resolutions (fixed seed), then times:
+#   - each ForgeryDetector check on its own (decode, ELA, tiled ELA,
+#     copy-move, compression, metadata, logic OCR), each on a freshly
+#     decoded document so no memoized intermediate is timed as a hit
+#   - AadhaarAnalyzer.analyze, grouped by how many OCR attempts were needed
+#   - the Flask /analyze route through the test client (result cache cleared)
+# Results are written as JSON so runs from two commits can be compared:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+SCALES = {"small": 1.0, "medium": 2.0, "large": 4.0}
+BASE_SIZE = (800, 600)
+
+# --- Synthetic documents ---
+def _font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+def _to_jpeg(img, quality=95):
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+def make_marksheet(scale, marks=(90, 85, 80), total=None, tampered=False):
+    if total is None:
+        total = sum(marks)
+    s = lambda v: int(v * scale)
+    img = Image.new("RGB", (s(BASE_SIZE[0]), s(BASE_SIZE[1])), "white")
+    d = ImageDraw.Draw(img)
+    font, header_font = _font(s(40)), _font(s(50))
+
+    d.text((s(50), s(50)), "OFFICIAL BOARD MARKSHEET", fill="black", font=header_font)
+    start_y, gap = 150, 60
+    for i, (subject, mark) in enumerate(zip(["Mathematics", "Science", "English"], marks)):
+        d.text((s(50), s(start_y + gap * i)), f"{subject:<11} : {mark}", fill="black", font=font)
+    d.line((s(50), s(start_y + gap * 3), s(750), s(start_y + gap * 3)), fill="black", width=max(1, s(3)))
+    d.text((s(50), s(start_y + gap * 3 + 20)), f"Total Score : {total}", fill="black", font=font)
+
+    if not tampered:
+        return _to_jpeg(img)
+
+    # Re-open a compressed copy and overwrite the total, as a forger would
+    base = Image.open(io.BytesIO(_to_jpeg(img, quality=100))).convert("RGB")
+    d = ImageDraw.Draw(base)
+    y = s(start_y + gap * 3 + 20)
+    d.rectangle((s(350), y, s(600), y + s(60)), fill="white")
+    d.text((s(350), y), str(total + 45), fill="black", font=font)
+    return _to_jpeg(base)
+
+def verhoeff_check_digit(digits11):
+    from aadhaar_logic import VerhoeffValidator
+    v = VerhoeffValidator()
+    for check in range(10):
+        if v.validate(digits11 + str(check)):
+            return str(check)
+    raise ValueError("no check digit")
+
+def make_aadhaar_card(scale, rng, tampered=False):
+    number = str(rng.randint(2, 9)) + "".join(str(rng.randint(0, 9)) for _ in range(10))
+    number += verhoeff_check_digit(number)
+    if tampered:
+        # A single changed digit breaks the checksum
+        number = number[:5] + str((int(number[5]) + 1) % 10) + number[6:]
+
+    s = lambda v: int(v * scale)
+    img = Image.new("RGB", (s(860), s(540)), (245, 240, 230))
+    d = ImageDraw.Draw(img)
+    d.rectangle((0, 0, s(860), s(70)), fill=(255, 153, 51))
+    d.text((s(30), s(15)), "GOVERNMENT OF INDIA", fill="black", font=_font(s(36)))
+    d.rectangle((s(40), s(110), s(230), s(340)), fill=(200, 200, 200))
+    d.text((s(260), s(120)), "Name: Test Person", fill="black", font=_font(s(28)))
+    d.text((s(260), s(170)), "DOB: 01/01/1990", fill="black", font=_font(s(28)))
+    d.text((s(260), s(220)), "Gender: Female", fill="black", font=_font(s(28)))
+    d.text((s(200), s(420)), f"{number[:4]} {number[4:8]} {number[8:]}", fill="black", font=_font(s(48)))
+    return _to_jpeg(img)
+
+def build_corpus(scales, seed=1234):
+    rng = random.Random(seed)
+    corpus = []
+    for label in scales:
+        scale = SCALES[label]
+        corpus.append(("marksheet", label, "authentic", make_marksheet(scale)))
+        corpus.append(("marksheet", label, "tampered", make_marksheet(scale, tampered=True)))
+        corpus.append(("aadhaar", label, "authentic", make_aadhaar_card(scale, rng)))
+        corpus.append(("aadhaar", label, "tampered", make_aadhaar_card(scale, rng, tampered=True)))
+    return corpus
+
+# --- Timing ---
+def summarize(name, samples, **extra):
+    samples = sorted(samples)
+    n = len(samples)
+    pct = lambda p: samples[min(n - 1, int(round(p / 100.0 * (n - 1))))]
+    result = {
+        "name": name,
+        "n": n,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p95_ms": round(pct(95) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "throughput_per_s": round(n / sum(samples), 3) if sum(samples) > 0 else None
+    }
+    result.update(extra)
+    return result
+
+def time_call(fn, iterations, warmup, setup=None):
+    # With setup, fn is called with setup()'s result; setup is not timed
+    for _ in range(warmup):
+        fn(setup()) if setup else fn()
+    samples = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def tesseract_version():
+    # None when no OCR engine is usable in this environment
+    from ocr_logic import get_ocr_backend, tesserocr
+    if get_ocr_backend().name == "tesserocr":
+        return tesserocr.tesseract_version().split()[1]
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+def tesseract_available():
+    return tesseract_version() is not None
+
+# --- Suites ---
+def bench_forgery_detector(corpus, iterations, warmup, with_ocr, upload_dir):
+    from backend_logic import ForgeryDetector
+    from document_logic import DecodedDocument
+
+    results = []
+    for doc_type, scale, variant, data in corpus:
+        if doc_type != "marksheet":
+            continue
+        tag = f"{scale}/{variant}"
+        results.append(summarize(f"forgery.decode[{tag}]", time_call(
+            lambda: ForgeryDetector(DecodedDocument(data, "bench.jpg")), iterations, warmup)))
+
+        # A new detector per iteration: ELA and the pipeline memoize their
+        # results on the document
+        fresh = lambda: ForgeryDetector(DecodedDocument(data, "bench.jpg"))
+        cases = [
+            ("ela", lambda d: d.perform_ela(output_dir=None)),
+            ("ela_with_visual", lambda d: d.perform_ela(output_dir=upload_dir)),
+            ("ela_tiles", lambda d: d.perform_tiled_ela()),
+            ("copy_move", lambda d: d.detect_copy_move()),
+            ("compression", lambda d: d.check_compression()),
+            ("metadata", lambda d: d.check_metadata()),
+        ]
+        for name, check in cases:
+            results.append(summarize(f"forgery.{name}[{tag}]", time_call(check, iterations, warmup, fresh)))
+        if with_ocr:
+            # Includes the layout OCR pass, which the pipeline caches
+            results.append(summarize(f"forgery.logic_ocr[{tag}]", time_call(
+                lambda d: d.verify_logical_consistency(), iterations, warmup, fresh)))
+    return results
+
+def bench_aadhaar(corpus, iterations, warmup, parallel):
+    from aadhaar_logic import AadhaarAnalyzer
+    from document_logic import DecodedDocument
+    from metrics_logic import trace_request
+
+    analyzer = AadhaarAnalyzer(parallel=parallel)
+    # Group samples by how many OCR attempts the search needed
+    by_attempts = {}
+    for doc_type, scale, variant, data in corpus:
+        if doc_type != "aadhaar":
+            continue
+        for i in range(warmup + iterations):
+            document = DecodedDocument(data, "card.jpg")
+            with trace_request() as trace:
+                started = time.perf_counter()
+                analyzer.analyze(document)
+                elapsed = time.perf_counter() - started
+            if i >= warmup:
+                by_attempts.setdefault((scale, trace.ocr_calls), []).append(elapsed)
+
+    mode = "parallel" if parallel else "sequential"
+    return [
+        summarize(f"aadhaar.analyze.{mode}[{scale}/attempts={attempts}]", samples, ocr_attempts=attempts)
+        for (scale, attempts), samples in sorted(by_attempts.items())
+    ]
+
+def bench_flask(corpus, iterations, warmup, with_ocr, work_dir):
+    # server.py writes uploads/ and certificates/ relative to the CWD. The
+    # CWD is not restored: the imported server's janitor keeps sweeping
+    # those relative paths
+    os.chdir(work_dir)
+    import server
+
+    client = server.app.test_client()
+    results = []
+    for doc_type, scale, variant, data in corpus:
+        if doc_type == "aadhaar" and not with_ocr:
+            continue
+
+        def post():
+            # Cold path: make sure every request runs the full pipeline
+            server.result_cache.clear()
+            response = client.post("/analyze", data={
+                "file": (io.BytesIO(data), "bench.jpg"),
+                "doc_type": doc_type
+            })
+            if response.status_code != 200:
+                raise RuntimeError(response.get_data(as_text=True))
+
+        results.append(summarize(f"flask.analyze.{doc_type}[{scale}/{variant}]",
+                                 time_call(post, iterations, warmup)))
+    return results
+
+# --- Reporting ---
+def run_metadata():
+    from ocr_logic import get_ocr_backend
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "tesseract": tesseract_version(),
+        "ocr_backend": get_ocr_backend().name
+    }
+
+def compare(current, baseline_path, threshold):
+    # Prints p50 deltas; returns True if any benchmark regressed > threshold
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressed = False
+    for r in current["results"]:
+        old = baseline.get(r["name"])
+        if old is None or not old["p50_ms"]:
+            continue
+        delta = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"]
+        flag = ""
+        if delta > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{r['name']:<60} {old['p50_ms']:>10.2f} -> {r['p50_ms']:>10.2f} ms ({delta:+.1%}){flag}",
+              file=sys.stderr)
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Sicario forensic pipelines.")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), choices=list(SCALES))
+    parser.add_argument("--suites", nargs="+", default=["forgery", "aadhaar", "flask"],
+                        choices=["forgery", "aadhaar", "flask"])
+    parser.add_argument("--parallel-ocr", action="store_true", help="Benchmark the parallel Aadhaar OCR mode")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="Write JSON results here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold for --compare")
+    args = parser.parse_args(argv)
+    # The flask suite changes the working directory (see bench_flask), so
+    # the output and baseline paths are fixed against the caller's first
+    for name in ("output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    with_ocr = tesseract_available()
+    if not with_ocr:
+        print("tesseract not found: OCR benchmarks are skipped", file=sys.stderr)
+
+    meta = run_metadata()
+    corpus = build_corpus(args.scales, args.seed)
+    upload_dir = tempfile.mkdtemp(prefix="sicario_bench_")
+
+    results = []
+    if "forgery" in args.suites:
+        results += bench_forgery_detector(corpus, args.iterations, args.warmup, with_ocr, upload_dir)
+    if "aadhaar" in args.suites and with_ocr:
+        results += bench_aadhaar(corpus, args.iterations, args.warmup, args.parallel_ocr)
+    if "flask" in args.suites:
+        results += bench_flask(corpus, args.iterations, args.warmup, with_ocr, upload_dir)
+
+    report = {"meta": meta, "config": vars(args), "results": results}
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.compare and compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
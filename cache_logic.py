@@ -0,0 +1,129 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Analysis Result Cache ---
+# Results are keyed on (file hash, doc_type, engine version). Lookups hit a
+# bounded in-process LRU first, then an optional directory of JSON files
+# that every gunicorn worker on the host can share.
+class ResultCache:
+    def __init__(self, max_entries=256, ttl=3600, disk_dir=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_hash, doc_type, engine_version):
+        return f"{file_hash}_{doc_type}_{engine_version}"
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self._expired(stored_at):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    return copy.deepcopy(value)
+
+        entry = self._disk_get(key)
+        if entry is None:
+            return None
+
+        # Promote disk hits into this worker's memory tier
+        stored_at, value = entry
+        self._memory_put(key, value, stored_at)
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        stored_at = time.time()
+        value = copy.deepcopy(value)
+        self._memory_put(key, value, stored_at)
+        self._disk_put(key, value, stored_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _memory_put(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # --- Disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self._expired(entry["stored_at"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["stored_at"], entry["value"]
+
+    def _disk_put(self, key, value, stored_at):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"stored_at": stored_at, "value": value}, f)
+            # Atomic rename so other workers never read a partial file
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._puts += 1
+        if self._puts % 100 == 0:
+            self.prune_disk()
+
+    def prune_disk(self):
+        # Drop expired entries, then the oldest ones beyond max_disk_entries
+        if not self.disk_dir:
+            return
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+
+        files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(files):
+            if i >= self.max_disk_entries or self._expired(mtime):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+
+# --- Certificate of Analysis (ReportLab) ---
+# Certificates are rendered on demand. An analysis only records the
+# certificate's fields as <cert_id>.json; the PDF is drawn the first time
+# it is requested (or on a background thread) and then served from disk.
+
+class CertificateTemplate:
+    # Layout is computed once; each certificate is one page with the static
+    # frame, title and footer followed by the variable fields.
+    def __init__(self, pagesize=letter):
+        self.pagesize = pagesize
+        self.width, self.height = pagesize
+        self.fields_top = self.height - 200
+
+    def _draw_frame(self, c):
+        width, height = self.width, self.height
+
+        c.setStrokeColor(colors.darkblue)
+        c.setLineWidth(5)
+        c.rect(30, 30, width - 60, height - 60)
+
+        c.setFont("Helvetica-Bold", 30)
+        c.drawCentredString(width / 2, height - 100, "CERTIFICATE OF ANALYSIS")
+
+        c.setFont("Helvetica", 12)
+        c.drawCentredString(width / 2, height - 130, "Sicario Forensic Document Analyzer")
+
+        c.setFont("Helvetica-Oblique", 10)
+        c.drawCentredString(width / 2, 60, "This document certifies that the above file has undergone forensic analysis.")
+        c.drawCentredString(width / 2, 45, "Generated by Sicario Secure Layer")
+
+    def render(self, cert_path, cert_id, filename, file_hash, analysis_type, timestamp):
+        c = canvas.Canvas(cert_path, pagesize=self.pagesize)
+
+        self._draw_frame(c)
+
+        y_pos = self.fields_top
+
+        def draw(label, value):
+            nonlocal y_pos
+            c.setFont("Helvetica-Bold", 14)
+            c.drawString(100, y_pos, label)
+            c.setFont("Helvetica", 14)
+            c.drawString(250, y_pos, value)
+            y_pos -= 40
+
+        draw("Reference ID:", cert_id)
+        draw("File Name:", filename)
+        draw("Analysis Type:", analysis_type)
+        draw("Timestamp:", timestamp)
+
+        y_pos -= 20
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(100, y_pos, "SHA-256 Secure Hash:")
+        c.setFont("Courier", 10)
+        c.drawString(100, y_pos - 20, file_hash)
+
+        c.save()
+
+TEMPLATE = CertificateTemplate()
+
+def generate_certificate(cert_id, filename, file_hash, analysis_type, timestamp, cert_folder="certificates"):
+    # Render immediately (eager mode and on-demand rendering both end here)
+    cert_path = os.path.join(cert_folder, f"{cert_id}.pdf")
+    tmp_path = _tmp_path(cert_path)
+    TEMPLATE.render(tmp_path, cert_id, filename, file_hash, analysis_type, timestamp)
+    # Concurrent renders of the same certificate are harmless; last rename wins
+    os.replace(tmp_path, cert_path)
+    return f"{cert_id}.pdf"
+
+def _tmp_path(path):
+    # Unique per writer, so a reader never sees a partially written file
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+# --- Deferred rendering ---
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPoolExecutor(max_workers=1)
+        return _render_pool
+
+def _metadata_path(cert_folder, cert_id):
+    return os.path.join(cert_folder, f"{cert_id}.json")
+
+def register_certificate(cert_id, filename, file_hash, analysis_type, timestamp,
+                         cert_folder="certificates", mode="lazy"):
+    # mode: "lazy" renders on first download, "background" renders on a
+    # worker thread now, "eager" renders before returning.
+    fields = {
+        "cert_id": cert_id,
+        "filename": filename,
+        "file_hash": file_hash,
+        "analysis_type": analysis_type,
+        "timestamp": timestamp
+    }
+    if mode == "eager":
+        return generate_certificate(cert_folder=cert_folder, **fields)
+
+    metadata_path = _metadata_path(cert_folder, cert_id)
+    tmp_path = _tmp_path(metadata_path)
+    with open(tmp_path, "w") as f:
+        json.dump(fields, f)
+    os.replace(tmp_path, metadata_path)
+
+    if mode == "background":
+        _get_render_pool().submit(generate_certificate, cert_folder=cert_folder, **fields)
+    return f"{cert_id}.pdf"
+
+def ensure_certificate(cert_filename, cert_folder="certificates"):
+    # Returns the PDF path, rendering it from stored fields if needed, or
+    # None if no such certificate was ever registered.
+    cert_path = os.path.join(cert_folder, cert_filename)
+    if os.path.isfile(cert_path):
+        return cert_path
+
+    cert_id, ext = os.path.splitext(cert_filename)
+    if ext != ".pdf":
+        return None
+    try:
+        with open(_metadata_path(cert_folder, cert_id), "r") as f:
+            fields = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    generate_certificate(cert_folder=cert_folder, **fields)
+    return cert_path
@@ -0,0 +1,142 @@
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image
+from preprocess_logic import PreprocessingPipeline, fit_to_pixels
+
+# --- Decoded Document ---
+# An upload is decoded exactly once into a single BGR uint8 buffer, which
+# every check shares:
+#   bgr      - the buffer itself (what OpenCV expects)
+#   rgb      - a channel-reversed NumPy view of the same memory
+#   pil      - a PIL image for the JPEG re-encode in ELA; PIL cannot wrap a
+#              3-channel buffer, so it is materialized lazily, only if asked
+#   pipeline - shared preprocessing intermediates (grayscale, Otsu, ...)
+# The raw bytes are kept for header-only readers such as EXIF.
+#
+# Decoded size is bounded by MAX_PIXELS (MAX_DECODE_PIXELS in the
+# environment). Oversized JPEGs are decoded directly at 1/2, 1/4 or 1/8
+# scale by libjpeg, so the full-resolution buffer never exists; other
+# formats are area-downscaled after decoding. Uploads whose header exceeds
+# the much higher MAX_SOURCE_PIXELS ceiling are refused with ImageTooLarge
+# before any pixels are allocated. original_size keeps the
+# uploaded dimensions, in the orientation OpenCV decodes them (it applies
+# the EXIF orientation; the header reports the stored raster).
+JPEG_REDUCED_MODES = ((2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                      (8, cv2.IMREAD_REDUCED_COLOR_8))
+
+class ImageTooLarge(ValueError):
+    pass
+
+class DecodedDocument:
+    MAX_PIXELS = int(os.environ.get("MAX_DECODE_PIXELS", "24000000"))
+    MAX_SOURCE_PIXELS = int(os.environ.get("MAX_SOURCE_PIXELS", "100000000"))
+
+    def __init__(self, data, name="document", max_pixels=None, bgr=None):
+        # bgr: an already-decoded raster (e.g. a rendered PDF page); data may
+        # then be empty, as there is no image file behind it
+        self.data = data
+        self.name = name
+        self.max_pixels = max_pixels or self.MAX_PIXELS
+        self.original_size = None
+        if bgr is not None:
+            self.original_size = (bgr.shape[1], bgr.shape[0])
+            self.bgr = fit_to_pixels(bgr, self.max_pixels)
+        else:
+            self.bgr = self._decode(data)
+        self._pil = None
+        self._pipeline = None
+
+    def _decode(self, data):
+        flags = cv2.IMREAD_COLOR
+        stored_size = None
+        try:
+            header = self.open_header()
+            stored_size = width, height = header.size
+            if header.format == "JPEG":
+                for factor, reduced in JPEG_REDUCED_MODES:
+                    if width * height <= self.max_pixels:
+                        break
+                    flags = reduced
+                    width, height = width // factor, height // factor
+        except Image.DecompressionBombError:
+            raise ImageTooLarge("Image is too large to analyze.")
+        except Exception:
+            pass  # Unknown to PIL; let OpenCV try
+        if stored_size is not None:
+            self.check_source_size(stored_size)
+
+        buffer = np.frombuffer(data, np.uint8)
+        bgr = cv2.imdecode(buffer, flags)
+        if bgr is None:
+            # Formats OpenCV cannot read (e.g. GIF) go through PIL once
+            try:
+                rgb = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+            except Exception:
+                raise ValueError("Could not load image file.")
+            bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+        self.original_size = (bgr.shape[1], bgr.shape[0])
+        if stored_size is not None:
+            # The header size, transposed if the decode was rotated by EXIF
+            # orientation 5-8
+            width, height = stored_size
+            rotated = width != height and (width > height) != (bgr.shape[1] > bgr.shape[0])
+            self.original_size = (height, width) if rotated else (width, height)
+        return fit_to_pixels(bgr, self.max_pixels)
+
+    @classmethod
+    def check_source_size(cls, size):
+        width, height = size
+        if width * height > cls.MAX_SOURCE_PIXELS:
+            raise ImageTooLarge(f"Image is too large to analyze ({width}x{height}; at most "
+                                f"{cls.MAX_SOURCE_PIXELS // 1_000_000} megapixels).")
+
+    @classmethod
+    def check_upload(cls, data):
+        # Header-only check, so a request can be refused before it is queued
+        try:
+            size = Image.open(io.BytesIO(data)).size
+        except Image.DecompressionBombError:
+            raise ImageTooLarge("Image is too large to analyze.")
+        except Exception:
+            return  # Not an image PIL knows (e.g. a PDF)
+        cls.check_source_size(size)
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read(), os.path.basename(path))
+
+    @classmethod
+    def load(cls, source, data=None):
+        # Accepts an existing document, in-memory bytes or a file path
+        if isinstance(source, DecodedDocument):
+            return source
+        if data is not None:
+            return cls(data, os.path.basename(source) if source else "document")
+        return cls.from_path(source)
+
+    @property
+    def is_jpeg(self):
+        return self.data[:3] == b"\xff\xd8\xff"
+
+    @property
+    def rgb(self):
+        return self.bgr[:, :, ::-1]
+
+    @property
+    def pil(self):
+        if self._pil is None:
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            self._pipeline = PreprocessingPipeline(self.bgr)
+        return self._pipeline
+
+    def open_header(self):
+        # PIL parses headers lazily; no pixels are decoded here
+        return Image.open(io.BytesIO(self.data))
@@ -0,0 +1,206 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import cv2
+import numpy as np
+
+# --- Perceptual fingerprints ---
+# Every analyzed document gets two 64-bit perceptual hashes of its content
+# crop (the page with scanner margins and borders trimmed off):
+#   phash - signs of the low-frequency DCT coefficients vs their median
+#   dhash - signs of horizontal brightness gradients on a 9x8 thumbnail
+# Re-saves, rescans and a few edited digits move each hash by a handful of
+# bits; an unrelated document is ~32 bits away.
+
+HASH_SIZE = 8
+NORMALIZED_SIZE = 512  # long side the page is shrunk to before cropping
+
+def content_crop(gray):
+    # Shrinks the page, then trims it to the bounding box of its ink so
+    # that margins and scan offsets do not shift the hashes
+    small = cv2.resize(gray, _fit_size(gray.shape, NORMALIZED_SIZE), interpolation=cv2.INTER_AREA)
+    ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    rows = np.flatnonzero(ink.mean(axis=1) > 2.0)
+    cols = np.flatnonzero(ink.mean(axis=0) > 2.0)
+    if len(rows) < HASH_SIZE or len(cols) < HASH_SIZE:
+        return small
+    return small[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+def _fit_size(shape, long_side):
+    height, width = shape[:2]
+    scale = min(1.0, long_side / float(max(height, width)))
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel().astype(np.uint8)).tobytes(), "big")
+
+def phash(crop):
+    small = cv2.resize(crop, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only carries overall brightness
+    return _pack(low > np.median(low.ravel()[1:]))
+
+def dhash(crop):
+    small = cv2.resize(crop, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+def fingerprint(gray):
+    crop = content_crop(gray)
+    return {"phash": f"{phash(crop):016x}", "dhash": f"{dhash(crop):016x}"}
+
+def hamming(a, b):
+    # Works on signed (SQLite) and unsigned forms alike
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+# --- Near-duplicate index ---
+# Multi-index hashing in SQLite: the 64-bit pHash is split into three
+# chunks of ~21 bits (about log2 of the expected row count, which keeps
+# buckets near-empty at millions of rows), each with its own covering
+# B-tree index. Two hashes within Hamming distance d agree to within
+# d // 3 bits on at least one chunk, so a lookup probes every chunk value
+# within that radius and checks the full distance of the rows it finds.
+# At the default d = 8 that is 254 probes per chunk, about 2 ms at a
+# million rows; each extra unit of radius costs roughly 7x more probes.
+# The dHash, which is noisier on rescans, is a looser second opinion that
+# filters out chance pHash collisions.
+
+CHUNK_BITS = (22, 21, 21)
+CHUNKS = len(CHUNK_BITS)
+
+def _chunks(value):
+    chunks, shift = [], 64
+    for bits in CHUNK_BITS:
+        shift -= bits
+        chunks.append((value >> shift) & ((1 << bits) - 1))
+    return chunks
+
+def _neighbours(chunk, bits, radius):
+    # Every bits-wide value within radius bits of chunk
+    values = [chunk]
+    for r in range(1, radius + 1):
+        for positions in itertools.combinations(range(bits), r):
+            flipped = chunk
+            for p in positions:
+                flipped ^= 1 << p
+            values.append(flipped)
+    return values
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class FingerprintIndex:
+    # One connection per thread; WAL lets gunicorn workers read while
+    # another one writes.
+    def __init__(self, path, max_distance=8, dhash_distance=16):
+        self.path = path
+        self.max_distance = max_distance
+        self.dhash_distance = dhash_distance
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "id INTEGER PRIMARY KEY, doc_type TEXT NOT NULL, file_hash TEXT NOT NULL, "
+                "phash INTEGER NOT NULL, dhash INTEGER NOT NULL, created REAL NOT NULL, "
+                + ", ".join(f"c{i} INTEGER NOT NULL" for i in range(CHUNKS)) + ")"
+            )
+            # Resubmitting the same file is not a new submission
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS fingerprints_file ON fingerprints (doc_type, file_hash)")
+            for i in range(CHUNKS):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS fingerprints_c{i} ON fingerprints (doc_type, c{i}, phash, dhash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_created ON fingerprints (created)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def add(self, doc_type, file_hash, fp, created=None):
+        ph, dh = int(fp["phash"], 16), int(fp["dhash"], 16)
+        with self._conn() as conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO fingerprints (doc_type, file_hash, phash, dhash, created, "
+                f"{', '.join(f'c{i}' for i in range(CHUNKS))}) VALUES ({', '.join('?' * (5 + CHUNKS))})",
+                (doc_type, file_hash, _signed(ph), _signed(dh), time.time() if created is None else created,
+                 *_chunks(ph))
+            )
+
+    def near(self, doc_type, fp, exclude_hash=None, limit=5):
+        # Prior submissions within max_distance (pHash) and dhash_distance:
+        # (count, [(pHash distance, file_hash, created)] for the closest
+        # `limit` of them)
+        ph, dh = int(fp["phash"], 16), int(fp["dhash"], 16)
+        signed_ph, signed_dh = _signed(ph), _signed(dh)
+        radius = self.max_distance // CHUNKS
+        conn = self._conn()
+        close = {}
+        for i, chunk in enumerate(_chunks(ph)):
+            values = _neighbours(chunk, CHUNK_BITS[i], radius)
+            # Answered from the covering index alone; file hashes are only
+            # read for the matches that are reported
+            rows = conn.execute(
+                f"SELECT id, phash, dhash FROM fingerprints INDEXED BY fingerprints_c{i} "
+                f"WHERE doc_type = ? AND c{i} IN ({', '.join('?' * len(values))})",
+                (doc_type, *values)
+            )
+            for row_id, row_ph, row_dh in rows:
+                distance = hamming(signed_ph, row_ph)
+                if distance <= self.max_distance and hamming(signed_dh, row_dh) <= self.dhash_distance:
+                    close[row_id] = distance
+
+        if exclude_hash is not None:
+            row = conn.execute(
+                "SELECT id FROM fingerprints WHERE doc_type = ? AND file_hash = ?", (doc_type, exclude_hash)
+            ).fetchone()
+            if row is not None:
+                close.pop(row[0], None)
+        closest = sorted(close, key=close.get)[:limit]
+        if not closest:
+            return len(close), []
+
+        rows = conn.execute(
+            f"SELECT id, file_hash, created FROM fingerprints WHERE id IN ({', '.join('?' * len(closest))})",
+            closest
+        )
+        return len(close), sorted((close[row_id], file_hash, created) for row_id, file_hash, created in rows)
+
+    def prune(self, max_age=None, max_rows=None, now=None):
+        # Forgets submissions older than max_age seconds, then the oldest
+        # ones until at most max_rows remain. Returns the rows removed.
+        now = time.time() if now is None else now
+        removed = 0
+        with self._conn() as conn:
+            if max_age is not None:
+                removed += conn.execute("DELETE FROM fingerprints WHERE created < ?", (now - max_age,)).rowcount
+            if max_rows is not None:
+                excess = conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0] - int(max_rows)
+                if excess > 0:
+                    removed += conn.execute(
+                        "DELETE FROM fingerprints WHERE id IN "
+                        "(SELECT id FROM fingerprints ORDER BY created LIMIT ?)", (excess,)
+                    ).rowcount
+        return removed
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+
+def open_fingerprint_index(path=None):
+    # FINGERPRINT_INDEX names the SQLite file (default: fingerprints.sqlite3
+    # under DATA_DIR); set it empty to disable
+    if path is None:
+        path = os.environ.get("FINGERPRINT_INDEX",
+                              os.path.join(os.environ.get("DATA_DIR", "data"), "fingerprints.sqlite3"))
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return FingerprintIndex(path, int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "8")))
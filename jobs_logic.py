@@ -0,0 +1,187 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class QueueFull(Exception):
+    pass
+
+# --- Background Analysis Jobs ---
+# Jobs run on a process pool so slow documents never pin a web worker.
+# The number of queued + running jobs is capped (max_pending); beyond that
+# submit() raises QueueFull and the caller should answer 429.
+#
+# Finished jobs are also written to jobs_dir as JSON, so a status request
+# that lands on a different gunicorn worker can still find the result.
+# Those records are not removed here; the server's StorageJanitor expires
+# them (JOB_TTL).
+class JobManager:
+    def __init__(self, max_workers=2, max_pending=32, jobs_dir=None, max_finished=1000):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.jobs_dir = jobs_dir
+        self.max_finished = max_finished
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        if jobs_dir:
+            os.makedirs(jobs_dir, exist_ok=True)
+
+    def _get_executor(self):
+        # Created lazily, after gunicorn has forked its workers. Spawned
+        # children import only the analysis modules, never the Flask app.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _submit(self, fn, *args):
+        # A pool whose child died (e.g. OOM-killed on a large upload) refuses
+        # all further work, so it is replaced once and the job resubmitted
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            return self._get_executor().submit(fn, *args)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def submit(self, fn, *args, on_done=None):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} pending).")
+            self._pending += 1
+            job_id = str(uuid.uuid4())
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "submitted_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+                "_future": None
+            }
+            self._jobs[job_id] = job
+
+        self._persist(job)
+        try:
+            future = self._submit(fn, *args)
+        except Exception as e:
+            self._finish(job, None, str(e), on_done)
+            return job_id
+
+        job["_future"] = future
+        future.add_done_callback(lambda f: self._on_future_done(job, f, on_done))
+        return job_id
+
+    def add_finished(self, result):
+        # Register an already-known result (e.g. a cache hit) as a done job
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": "done",
+            "submitted_at": now,
+            "finished_at": now,
+            "result": result,
+            "error": None,
+            "_future": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim()
+        self._persist(job)
+        return job_id
+
+    def _on_future_done(self, job, future, on_done):
+        if future.cancelled():
+            self._finish(job, None, "Job was cancelled.", on_done)
+            return
+        error = future.exception()
+        if error is not None:
+            self._finish(job, None, str(error), on_done)
+        else:
+            self._finish(job, future.result(), None, on_done)
+
+    def _finish(self, job, result, error, on_done):
+        job["result"] = result
+        job["error"] = error
+        job["status"] = "failed" if error else "done"
+        job["finished_at"] = time.time()
+        job["_future"] = None
+        with self._lock:
+            self._pending -= 1
+            self._trim()
+        self._persist(job)
+        if on_done is not None and error is None:
+            on_done(result)
+
+    def _trim(self):
+        # Keep at most max_finished completed jobs in memory (lock held)
+        finished = [jid for jid, j in self._jobs.items() if j["status"] in ("done", "failed")]
+        for jid in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[jid]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._load(job_id)
+
+        future = job["_future"]
+        view = {k: v for k, v in job.items() if k != "_future"}
+        if view["status"] == "queued" and future is not None and future.running():
+            view["status"] = "running"
+        return view
+
+    # --- Shared job records ---
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _persist(self, job):
+        if not self.jobs_dir:
+            return
+        record = {k: v for k, v in job.items() if k != "_future"}
+        path = self._path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load(self, job_id):
+        if not self.jobs_dir:
+            return None
+        # Job ids are uuid4 strings; refuse anything that could escape jobs_dir
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        try:
+            with open(self._path(job_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,251 @@
+import io
+import cv2
+import numpy as np
+from PIL import Image
+from metadata_logic import parse_headers
+
+# --- JPEG compression history ---
+# Reads what a JPEG's own compression says about its past, without
+# re-encoding it (compare ELA in backend_logic):
+#   quality - the luminance quantization table (DQT) is matched against
+#             the IJG tables that libjpeg, PIL and OpenCV write at each
+#             quality; cameras and some editors write other ("custom")
+#             tables
+#   primary - the stored DCT coefficients of a once-compressed image fill
+#             every histogram bin. A second compression with a finer step
+#             leaves a periodic comb of empty bins, from which the first
+#             step, and so the first quality, is recovered
+#   grid    - after a crop or a paste, the first compression's 8x8 grid no
+#             longer lines up with the current one. Blocks cut on that old
+#             grid had their high frequencies zeroed, so the
+#             high-frequency energy dips at its offset
+# The coefficients come from a blockwise DCT of the luma plane, which
+# PIL's draft mode has libjpeg decode on its own (no chroma, no colour
+# conversion). Dividing by the file's own table and rounding recovers the
+# stored coefficients, so no entropy decoding happens in Python.
+
+MAX_LUMA_PIXELS = 24_000_000
+
+# IJG (Annex K) luminance table, natural (row-major) order
+STANDARD_LUMA = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+])
+
+def _zigzag():
+    # ZIGZAG[i] is the natural index of the i-th coefficient in zigzag order
+    cells = sorted(((r, c) for r in range(8) for c in range(8)),
+                   key=lambda rc: (rc[0] + rc[1], rc[0] if (rc[0] + rc[1]) % 2 else rc[1]))
+    return np.array([r * 8 + c for r, c in cells])
+
+ZIGZAG = _zigzag()
+
+def ijg_tables(base=STANDARD_LUMA):
+    # Row q - 1 is the table libjpeg writes at quality q
+    quality = np.arange(1, 101)[:, None]
+    scale = np.where(quality < 50, 5000 // quality, 200 - 2 * quality)
+    return np.clip((base[None, :] * scale + 50) // 100, 1, 255)
+
+IJG_TABLES = ijg_tables()
+
+# Double quantization is tested on the low-frequency AC coefficients, the
+# only ones most blocks of a document leave non-zero
+LOW = 4
+PRIMARY_MODES = ZIGZAG[1:10]  # all within the LOW x LOW corner
+MIN_COEFFICIENTS = 100  # non-zero values a mode needs to be tested
+MIN_EMPTY_SHARE = 0.3   # a step must predict at least this much empty mass
+MAX_EMPTY_RATIO = 0.3   # ...and those bins must hold less than this share of it
+MAX_PRIMARY_STEP = 40   # about quality 20 for these modes
+
+# Grid alignment is measured on a sample of textured blocks over the
+# ZIGZAG[GRID_FREQUENCIES:] coefficients. Half-block shifts along one axis
+# dip on every compressed image and are not considered.
+GRID_BLOCKS = 1024
+GRID_MIN_STD = 5.0
+GRID_FREQUENCIES = 20
+GRID_MIN_DIP = 0.075
+
+
+def natural_order(zigzag_table):
+    table = np.empty(64, np.int64)
+    table[ZIGZAG] = zigzag_table
+    return table
+
+def estimate_quality(table):
+    # (nearest IJG quality, whether the table is exactly that IJG table)
+    error = np.abs(IJG_TABLES - table[None, :]).mean(axis=1)
+    best = int(np.argmin(error))
+    return best + 1, bool(error[best] == 0)
+
+def read_luma(data, max_pixels=MAX_LUMA_PIXELS):
+    # The luma plane at full scale, or None if it is too large or unreadable
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format != "JPEG" or image.width * image.height > max_pixels:
+            return None
+        # Same size: libjpeg skips chroma but keeps the full-scale DCT grid
+        image.draft("L", image.size)
+        return np.asarray(image.convert("L"))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+def dct_basis():
+    # Orthonormal 8-point DCT-II matrix, as JPEG uses
+    x = np.arange(8)
+    basis = np.cos(np.pi * (2 * x[None, :] + 1) * x[:, None] / 16.0) * 0.5
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+def block_corners(luma, count, min_std, seed=0):
+    # Top-left corners of up to count 8x8 blocks of the current grid whose
+    # 16 x 16 neighbourhood is textured, with room for an 8x8 window at
+    # any offset (15 x 15 pixels)
+    rows, cols = luma.shape[0] // 8 - 1, luma.shape[1] // 8 - 1
+    if rows < 1 or cols < 1:
+        return np.empty(0, np.intp), np.empty(0, np.intp)
+    image = luma.astype(np.float32)
+    mean = cv2.boxFilter(image, cv2.CV_32F, (16, 16), anchor=(0, 0), borderType=cv2.BORDER_CONSTANT)
+    mean_sq = cv2.sqrBoxFilter(image, cv2.CV_32F, (16, 16), anchor=(0, 0), borderType=cv2.BORDER_CONSTANT)
+    variance = (mean_sq - mean * mean)[0:rows * 8:8, 0:cols * 8:8]
+    ys, xs = np.nonzero(variance > min_std * min_std)
+    if len(ys) > count:
+        keep = np.random.default_rng(seed).choice(len(ys), count, replace=False)
+        ys, xs = ys[keep], xs[keep]
+    return ys * 8, xs * 8
+
+def patches(luma, ys, xs, size):
+    r = np.arange(size)
+    return luma[ys[:, None, None] + r[None, :, None], xs[:, None, None] + r[None, None, :]].astype(np.float32)
+
+def low_frequencies(luma, basis):
+    # The LOW x LOW lowest DCT coefficients of every block of the current
+    # grid, as (blocks, 64) in natural order with the rest left zero
+    rows, cols = luma.shape[0] // 8, luma.shape[1] // 8
+    blocks = luma[:rows * 8, :cols * 8].reshape(rows, 8, cols, 8).transpose(0, 2, 1, 3).astype(np.float32)
+    low = basis[:LOW]
+    coefficients = np.zeros((rows * cols, 8, 8), np.float32)
+    coefficients[:, :LOW, :LOW] = (low @ blocks @ low.T).reshape(-1, LOW, LOW)
+    return coefficients.reshape(-1, 64)
+
+def primary_steps(coefficients, table, modes=PRIMARY_MODES):
+    # {mode: first quantization step, or None if the mode shows a single
+    # compression} for the modes with enough non-zero coefficients
+    steps = {}
+    for mode in modes:
+        step = int(table[mode])
+        k = np.abs(np.round(coefficients[:, mode] / step)).astype(np.int64)
+        k = k[(k > 0) & (k < 256)]
+        if len(k) < MIN_COEFFICIENTS:
+            continue
+        histogram = np.bincount(k, minlength=257)[:257].astype(np.float64)
+        # Padded running sums: window sums are two lookups per bin
+        pad = MAX_PRIMARY_STEP + 1
+        cumulative = np.concatenate([np.zeros(pad), np.cumsum(histogram), np.full(pad, histogram.sum())])
+        steps[int(mode)] = None
+        for first in range(step + 1, min(step * (int(k.max()) + 1), MAX_PRIMARY_STEP + 1)):
+            # Bins a value quantized by first can land in once requantized
+            # by step (both roundings of exact halves)
+            x = np.arange(int(256 * step / first) + 2) * first / float(step)
+            empty = np.ones(258, bool)
+            empty[np.minimum(np.floor(x + 0.5), 257).astype(np.int64)] = False
+            empty[np.minimum(np.ceil(x - 0.5), 257).astype(np.int64)] = False
+            empty = empty[:257]
+            # What the empty bins would hold in a smooth histogram
+            half = int(np.ceil(first / float(step)))
+            start = pad - half - 1
+            smooth = cumulative[start + 2 * half + 1:start + 2 * half + 258] - cumulative[start:start + 257]
+            expected = smooth[empty].sum() / smooth[1:].sum()
+            if expected >= MIN_EMPTY_SHARE and histogram[empty].sum() / histogram[1:].sum() < MAX_EMPTY_RATIO * expected:
+                steps[int(mode)] = first  # the largest consistent step wins
+    return steps
+
+def grid_offset(luma, basis=None):
+    # ((dy, dx), dip) of the strongest misaligned 8x8 grid, or None
+    basis = dct_basis() if basis is None else basis
+    ys, xs = block_corners(luma, GRID_BLOCKS, GRID_MIN_STD)
+    if len(ys) < 64:
+        return None
+    windows = patches(luma, ys, xs, 15)
+    high = ZIGZAG[GRID_FREQUENCIES:]
+    energy = np.empty((8, 8))
+    for dy in range(8):
+        vertical = basis @ windows[:, dy:dy + 8, :]
+        for dx in range(8):
+            coefficients = (vertical[:, :, dx:dx + 8] @ basis.T).reshape(-1, 64)[:, high]
+            energy[dy, dx] = np.log1p(np.abs(coefficients)).mean()
+
+    dips = {}
+    for dy in range(8):
+        for dx in range(8):
+            if (dy, dx) in ((0, 0), (0, 4), (4, 0)):
+                continue
+            # Compared with its point reflection, on which the current
+            # grid has the same effect, and with its neighbours off the
+            # current grid's lines (along the line for offsets on one)
+            mirror = (-dy % 8, -dx % 8)
+            refs = [energy[mirror]] if mirror != (dy, dx) else []
+            if dy == 0:
+                neighbours = [(0, (dx - 1) % 8), (0, (dx + 1) % 8)]
+            elif dx == 0:
+                neighbours = [((dy - 1) % 8, 0), ((dy + 1) % 8, 0)]
+            else:
+                neighbours = [p for p in (((dy - 1) % 8, dx), ((dy + 1) % 8, dx), (dy, (dx - 1) % 8), (dy, (dx + 1) % 8))
+                              if p[0] and p[1]]
+            refs += [energy[p] for p in neighbours if p != (0, 0)]
+            dips[(dy, dx)] = 1.0 - energy[dy, dx] / float(np.mean(refs))
+    best = max(dips, key=dips.get)
+    return best, dips[best]
+
+
+def analyze_compression(data, max_pixels=MAX_LUMA_PIXELS):
+    headers = parse_headers(data)
+    if headers.format != "JPEG" or 0 not in headers.quant_tables:
+        return {"status": "Pass", "details": "Not a JPEG; no compression history to read.", "quality": None}
+    table = natural_order(headers.quant_tables[0])
+    quality, standard = estimate_quality(table)
+    saved = f"Saved at quality {quality}" if standard else f"Saved with a custom table (about quality {quality})"
+
+    primary, grid = None, None
+    luma = read_luma(data, max_pixels)
+    if luma is not None:
+        basis = dct_basis()
+        # Double compression needs the comb in two thirds of the tested
+        # modes; the first quality is the IJG table closest to its steps
+        steps = primary_steps(low_frequencies(luma, basis), table)
+        found = {mode: step for mode, step in steps.items() if step is not None}
+        if len(steps) >= 3 and 3 * len(found) >= 2 * len(steps):
+            modes = list(found)
+            error = np.abs(IJG_TABLES[:, modes] - np.array([found[m] for m in modes])[None, :]).mean(axis=1)
+            primary = int(np.argmin(error)) + 1
+        offset = grid_offset(luma, basis)
+        if offset is not None and offset[1] >= GRID_MIN_DIP:
+            (dy, dx), dip = offset
+            grid = {"dx": dx, "dy": dy, "dip": round(float(dip), 3)}
+
+    findings = []
+    if primary is not None:
+        findings.append(f"it was compressed before at about quality {primary}")
+    if grid is not None:
+        findings.append(f"an earlier 8x8 JPEG grid is offset by ({grid['dx']}, {grid['dy']}) px, so it was "
+                        "cropped or pasted after that save")
+    if luma is None:
+        status, details = "Pass", f"{saved}; the image is too large or damaged to read its history."
+    elif findings:
+        status, details = "Warn", f"{saved}; " + "; ".join(findings) + "."
+    else:
+        status, details = "Pass", f"{saved}; no sign of an earlier JPEG compression."
+
+    return {
+        "status": status,
+        "details": details,
+        "quality": quality,
+        "standard_table": standard,
+        "primary_quality": primary,
+        "grid_offset": grid
+    }
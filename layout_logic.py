@@ -0,0 +1,132 @@
+import re
+from metrics_logic import record_ocr_call
+from ocr_logic import get_ocr_backend
+
+# --- Structured OCR ---
+# Each document gets one layout-aware OCR pass (word boxes and
+# confidences), cached on its PreprocessingPipeline. Text checks ask the
+# cached Layout for lines, labelled values and numeric cells instead of
+# running Tesseract again, so adding a check costs no OCR time.
+#
+# The pass reads the OCR-scaled Otsu image with psm 6 (one uniform block
+# of text), the same input as the Aadhaar engine's first full-card attempt.
+
+LAYOUT_STRATEGY = "Otsu Threshold"
+LAYOUT_CONFIG = r'--oem 3 --psm 6'
+
+# "1,180.00", "Rs.450", "(18%)" -> 1180.0, 450.0, 18.0
+NUMBER = re.compile(r'^[^\d]{0,4}?(\d{1,3}(?:,\d{2,3})+|\d+)(\.\d+)?(%?)[^\d]{0,2}$')
+
+
+class Word:
+    __slots__ = ("text", "conf", "box", "value", "percent")
+
+    def __init__(self, text, conf=100.0, box=None):
+        self.text = text
+        self.conf = conf
+        self.box = box  # (x, y, w, h) at native resolution, None for text layers
+        self.value, self.percent = None, False
+        match = NUMBER.match(text)
+        if match:
+            whole, fraction, percent = match.groups()
+            self.value = float(whole.replace(",", "") + (fraction or ""))
+            self.percent = bool(percent)
+
+    @property
+    def is_number(self):
+        return self.value is not None
+
+
+class Line:
+    __slots__ = ("words", "text")
+
+    def __init__(self, words):
+        self.words = words
+        self.text = " ".join(w.text for w in words)
+
+    @property
+    def numbers(self):
+        return [w for w in self.words if w.is_number]
+
+    @property
+    def amount(self):
+        # The right-most number that is not a percentage, e.g. the value
+        # of "CGST @ 9% 90.00"
+        amounts = [w for w in self.numbers if not w.percent]
+        return amounts[-1] if amounts else None
+
+    def last_digits(self):
+        # The right-most digit run on the line as a numeric cell, for
+        # values OCR'd with stray marks (e.g. "2'300" -> 300)
+        for w in reversed(self.words):
+            runs = re.findall(r'\d+', w.text)
+            if runs:
+                return Word(runs[-1], w.conf, w.box)
+        return None
+
+    @property
+    def box(self):
+        boxes = [w.box for w in self.words if w.box is not None]
+        if not boxes:
+            return None
+        x0 = min(b[0] for b in boxes)
+        y0 = min(b[1] for b in boxes)
+        x1 = max(b[0] + b[2] for b in boxes)
+        y1 = max(b[1] + b[3] for b in boxes)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+
+class Layout:
+    def __init__(self, lines):
+        self.lines = [line for line in lines if line.words]
+
+    @classmethod
+    def from_text(cls, text):
+        # An embedded text layer: same queries, no boxes
+        return cls([Line([Word(t) for t in row.split()]) for row in text.splitlines()])
+
+    @classmethod
+    def from_tsv(cls, tsv, scale=1.0):
+        # Tesseract image_to_data TSV -> lines of words. Boxes are divided
+        # by scale to map them back onto the native image.
+        rows = {}
+        for row in tsv.splitlines()[1:]:
+            fields = row.split("\t")
+            if len(fields) < 12 or fields[0] != "5" or not fields[11].strip():
+                continue
+            left, top, width, height = (int(f) for f in fields[6:10])
+            box = tuple(int(round(v / scale)) for v in (left, top, width, height))
+            key = tuple(int(f) for f in fields[1:5])  # page, block, paragraph, line
+            rows.setdefault(key, []).append(Word(fields[11].strip(), float(fields[10]), box))
+        return cls([Line(rows[key]) for key in sorted(rows)])
+
+    @property
+    def text(self):
+        return "\n".join(line.text for line in self.lines)
+
+    @property
+    def words(self):
+        return [w for line in self.lines for w in line.words]
+
+    @property
+    def numbers(self):
+        return [w for line in self.lines for w in line.numbers]
+
+    def find_lines(self, pattern):
+        # Lines whose text matches a (case-insensitive) label pattern
+        regex = re.compile(pattern, re.IGNORECASE)
+        return [line for line in self.lines if regex.search(line.text)]
+
+    def labelled_value(self, pattern):
+        # (line, amount cell) for the first line matching pattern that has
+        # an amount
+        for line in self.find_lines(pattern):
+            if line.amount is not None:
+                return line, line.amount
+        return None, None
+
+
+def read_layout(pipeline, ocr=None):
+    record_ocr_call("layout", LAYOUT_STRATEGY, LAYOUT_CONFIG)
+    tsv = (ocr or get_ocr_backend()).image_to_data(pipeline.ocr_otsu, LAYOUT_CONFIG)
+    return Layout.from_tsv(tsv, pipeline.ocr_scale)
@@ -0,0 +1,323 @@
+import bisect
+import re
+import struct
+import zlib
+
+# --- Header-only metadata engine ---
+# Reads the metadata an upload carries straight from its bytes, without
+# decoding any pixels:
+#   JPEG - APPn/COM segments up to the first scan (SOS): EXIF, XMP,
+#          Photoshop resources (APP13), quantization tables
+#   PNG  - tEXt/iTXt/zTXt and eXIf chunks; IDAT is skipped by length
+#   WebP - EXIF and XMP chunks
+#   TIFF - IFD0 and the EXIF IFD
+# Software-bearing fields are then matched against one compiled signature
+# table in a single regex pass.
+
+HEADER_READ_LIMIT = 1024 * 1024
+
+# EXIF/TIFF ASCII tags worth reading; everything else is skipped
+EXIF_TAGS = {
+    0x000B: "ProcessingSoftware",
+    0x010F: "Make",
+    0x0110: "Model",
+    0x0131: "Software",
+    0x0132: "DateTime",
+    0x013B: "Artist",
+    0x013C: "HostComputer",
+    0x9003: "DateTimeOriginal",
+    0x9004: "DateTimeDigitized",
+}
+EXIF_IFD_POINTER = 0x8769
+
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_FIELDS = re.compile(
+    r'(xmp:CreatorTool|stEvt:softwareAgent|stEvt:action|photoshop:History)'
+    r'\s*(?:=\s*"([^"]*)"|>([^<]*)<)'
+)
+
+# Fields that name the software that wrote the file
+SOFTWARE_FIELDS = {"Software", "ProcessingSoftware", "CreatorTool", "softwareAgent", "Comment"}
+
+# Image editors, most specific first; when several entries match one field
+# the earliest entry wins. Only software that edits pixels belongs here:
+# PDF tools, scanner apps and printer drivers write the software fields of
+# ordinary, unedited documents.
+EDITING_SOFTWARE = [
+    ("Adobe Photoshop", r"photoshop"),
+    ("Adobe Lightroom", r"lightroom"),
+    ("Adobe Illustrator", r"illustrator"),
+    ("GIMP", r"\bgimp\b"),
+    ("Paint.NET", r"paint\.net"),
+    ("Pixelmator", r"pixelmator"),
+    ("Affinity Photo", r"affinity photo"),
+    ("Photopea", r"photopea"),
+    ("Canva", r"\bcanva\b"),
+    ("PicsArt", r"picsart"),
+    ("Snapseed", r"snapseed"),
+    ("Corel", r"corel|paintshop"),
+    ("Krita", r"\bkrita\b"),
+    ("Inkscape", r"inkscape"),
+    ("ImageMagick", r"imagemagick"),
+    ("Fotor", r"\bfotor\b"),
+    ("Microsoft Paint", r"mspaint|microsoft paint"),
+    ("Image editor", r"photo editor|image editor"),
+]
+SIGNATURES = re.compile(
+    "|".join(f"(?P<s{i}>{pattern})" for i, (_, pattern) in enumerate(EDITING_SOFTWARE)),
+    re.IGNORECASE
+)
+
+
+class ImageHeaders:
+    def __init__(self, format=None):
+        self.format = format
+        self.fields = []          # (source, name, value)
+        self.quant_tables = {}    # table id -> 64 values in zigzag order
+        self.photoshop_resources = False
+
+    def add(self, source, name, value):
+        value = value.strip()
+        if value:
+            self.fields.append((source, name, value))
+
+    def get(self, name):
+        for _, field, value in self.fields:
+            if field == name:
+                return value
+        return None
+
+
+def parse_headers(data):
+    # Truncated or malformed headers keep whatever was read before the damage
+    headers = ImageHeaders()
+    try:
+        if data.startswith(b"\xff\xd8"):
+            headers.format = "JPEG"
+            _parse_jpeg(data, headers)
+        elif data.startswith(b"\x89PNG\r\n\x1a\n"):
+            headers.format = "PNG"
+            _parse_png(data, headers)
+        elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            headers.format = "WEBP"
+            _parse_webp(data, headers)
+        elif data[:4] in (b"II*\x00", b"MM\x00*"):
+            headers.format = "TIFF"
+            parse_tiff(data, headers, "TIFF")
+    except (struct.error, IndexError):
+        pass
+    return headers
+
+
+def _parse_jpeg(data, headers):
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            break
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # no length field
+            pos += 2
+            continue
+        if marker in (0xDA, 0xD9):  # start of scan: only pixels follow
+            break
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        segment = data[pos + 4:pos + 2 + length]
+
+        if marker == 0xE1:
+            if segment.startswith(b"Exif\x00\x00"):
+                parse_tiff(segment[6:], headers)
+            elif segment.startswith(XMP_HEADER):
+                parse_xmp(segment[len(XMP_HEADER):], headers)
+        elif marker == 0xED and segment.startswith(b"Photoshop 3.0\x00"):
+            headers.photoshop_resources = True
+        elif marker == 0xFE:
+            headers.add("JPEG", "Comment", segment.decode("latin-1"))
+        elif marker == 0xDB:
+            _parse_dqt(segment, headers)
+        pos += 2 + length
+
+
+def _parse_dqt(segment, headers):
+    pos = 0
+    while pos < len(segment):
+        precision, table_id = segment[pos] >> 4, segment[pos] & 0x0F
+        if precision:
+            values = struct.unpack_from(">64H", segment, pos + 1)
+            pos += 129
+        else:
+            values = tuple(segment[pos + 1:pos + 65])
+            pos += 65
+        if len(values) == 64:
+            headers.quant_tables[table_id] = values
+
+
+def _parse_png(data, headers):
+    pos, end = 8, len(data)
+    while pos + 8 <= end:
+        length, chunk_type = struct.unpack_from(">I4s", data, pos)
+        body = data[pos + 8:pos + 8 + length]
+
+        if chunk_type == b"tEXt":
+            key, _, text = body.partition(b"\x00")
+            headers.add("PNG", key.decode("latin-1"), text.decode("latin-1"))
+        elif chunk_type == b"zTXt":
+            key, _, rest = body.partition(b"\x00")
+            headers.add("PNG", key.decode("latin-1"), _inflate(rest[1:]).decode("latin-1"))
+        elif chunk_type == b"iTXt":
+            key, _, rest = body.partition(b"\x00")
+            compressed = rest[:1] == b"\x01"
+            _, _, rest = rest[2:].partition(b"\x00")  # language tag
+            _, _, text = rest.partition(b"\x00")      # translated keyword
+            text = _inflate(text) if compressed else text
+            if key == b"XML:com.adobe.xmp":
+                parse_xmp(text, headers)
+            else:
+                headers.add("PNG", key.decode("latin-1"), text.decode("utf-8", "replace"))
+        elif chunk_type == b"eXIf":
+            parse_tiff(body, headers)
+        elif chunk_type == b"IEND":
+            break
+        pos += 12 + length
+
+
+def _parse_webp(data, headers):
+    pos, end = 12, len(data)
+    while pos + 8 <= end:
+        fourcc, length = struct.unpack_from("<4sI", data, pos)
+        body = data[pos + 8:pos + 8 + length]
+        if fourcc == b"EXIF":
+            parse_tiff(body[6:] if body.startswith(b"Exif\x00\x00") else body, headers)
+        elif fourcc == b"XMP ":
+            parse_xmp(body, headers)
+        pos += 8 + length + (length & 1)
+
+
+def _inflate(data, limit=HEADER_READ_LIMIT):
+    # Bounded, so a small zTXt chunk cannot inflate into a huge string
+    try:
+        return zlib.decompressobj().decompress(data, limit)
+    except zlib.error:
+        return b""
+
+
+def parse_tiff(tiff, headers, source="EXIF"):
+    if tiff[:2] == b"II":
+        order = "<"
+    elif tiff[:2] == b"MM":
+        order = ">"
+    else:
+        return
+    if len(tiff) < 8:
+        return
+
+    pending, seen = [struct.unpack_from(order + "I", tiff, 4)[0]], set()
+    while pending:
+        ifd = pending.pop()
+        if ifd in seen or ifd + 2 > len(tiff):
+            continue
+        seen.add(ifd)
+        count = struct.unpack_from(order + "H", tiff, ifd)[0]
+        for i in range(min(count, 1024)):
+            entry = ifd + 2 + 12 * i
+            if entry + 12 > len(tiff):
+                break
+            tag, value_type, n = struct.unpack_from(order + "HHI", tiff, entry)
+            if tag == EXIF_IFD_POINTER:
+                pending.append(struct.unpack_from(order + "I", tiff, entry + 8)[0])
+            elif tag in EXIF_TAGS and value_type == 2:  # ASCII
+                if n <= 4:
+                    raw = tiff[entry + 8:entry + 8 + n]
+                else:
+                    start = struct.unpack_from(order + "I", tiff, entry + 8)[0]
+                    raw = tiff[start:start + n]
+                headers.add(source, EXIF_TAGS[tag], raw.split(b"\x00", 1)[0].decode("latin-1"))
+
+
+def parse_xmp(packet, headers):
+    text = packet.decode("utf-8", "replace")
+    for match in XMP_FIELDS.finditer(text):
+        name = match.group(1).split(":", 1)[1]
+        headers.add("XMP", name, match.group(2) if match.group(2) is not None else match.group(3))
+
+
+# --- Scoring ---
+def match_software(headers):
+    # One pass of the signature table over every software-bearing field.
+    # Returns [(source, field, value, software)], one entry per field.
+    fields = [f for f in headers.fields if f[1] in SOFTWARE_FIELDS]
+    if not fields:
+        return []
+    starts, offset = [], 0
+    for _, _, value in fields:
+        starts.append(offset)
+        offset += len(value) + 1
+    haystack = "\n".join(value for _, _, value in fields)
+
+    found = {}
+    for match in SIGNATURES.finditer(haystack):
+        i = bisect.bisect_right(starts, match.start()) - 1
+        rank = int(match.lastgroup[1:])
+        found[i] = min(found.get(i, rank), rank)
+    return [fields[i] + (EDITING_SOFTWARE[rank][0],) for i, rank in sorted(found.items())]
+
+
+def editing_hints(headers):
+    hints = []
+    if headers.photoshop_resources:
+        hints.append("Photoshop image resources (APP13) present")
+    modified, captured = headers.get("DateTime"), headers.get("DateTimeOriginal")
+    if modified and captured and modified != captured:
+        hints.append(f"Modified {modified}, originally created {captured}")
+    actions = [v for s, name, v in headers.fields if name == "action" and v in ("saved", "derived", "converted")]
+    if actions:
+        hints.append(f"XMP edit history: {len(actions)} event(s)")
+    return hints
+
+
+def analyze_metadata(data):
+    return score_headers(parse_headers(data))
+
+def analyze_pdf_metadata(info):
+    # info: a PDF's document information (Creator, Producer, CreationDate,
+    # ModDate). Creator and Producer are informational: Acrobat, scanner
+    # apps and printer drivers write them on every ordinary PDF. Only a
+    # Creator naming an image editor (e.g. a page exported from
+    # Photoshop) counts as a trace.
+    headers = ImageHeaders("PDF")
+    creator, producer = info.get("Creator") or "", info.get("Producer") or ""
+    headers.add("PDF", "CreatorTool", creator)
+    created, modified = info.get("CreationDate"), info.get("ModDate")
+    if created and modified and created != modified:
+        headers.add("PDF", "DateTimeOriginal", created)
+        headers.add("PDF", "DateTime", modified)
+    result = score_headers(headers)
+    tools = [value.strip() for value in (creator, producer) if value.strip()]
+    if tools and not result["software"]:
+        result["details"] += " Created with " + " / ".join(dict.fromkeys(tools)) + "."
+    result["creator"], result["producer"] = creator.strip() or None, producer.strip() or None
+    return result
+
+def score_headers(headers):
+    software = match_software(headers)
+    hints = editing_hints(headers)
+
+    if software:
+        status = "Fail"
+        details = "Traces found: " + ", ".join(f"{name}: {value}" for _, name, value, _ in software)
+    elif hints:
+        status = "Warn"
+        details = "Possible editing: " + "; ".join(hints) + "."
+    else:
+        status = "Pass"
+        details = "No editing software traces found."
+
+    return {
+        "status": status,
+        "details": details,
+        "format": headers.format,
+        "software": sorted({s for _, _, _, s in software}),
+        "hints": hints
+    }
@@ -0,0 +1,175 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Lightweight metrics (Prometheus text format) ---
+# Counters and histograms live in this process. Under gunicorn every worker
+# exposes its own series, which Prometheus aggregates across scrape targets.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', bound)])} {c}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = Histogram(
+    "sicario_stage_seconds", "Time spent in each analysis stage.", ["stage"])
+REQUEST_SECONDS = Histogram(
+    "sicario_request_seconds", "End-to-end analysis request time.", ["route", "doc_type"])
+OCR_CALLS = Counter(
+    "sicario_ocr_calls_total", "Tesseract invocations.", ["caller", "strategy", "config"])
+OCR_CALLS_PER_REQUEST = Histogram(
+    "sicario_ocr_calls_per_request", "Tesseract invocations per request.", ["doc_type"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16))
+AADHAAR_WINNER = Counter(
+    "sicario_aadhaar_ocr_winner_total", "Strategy/config that found the Aadhaar number.", ["strategy", "config"])
+
+# doc_type comes from the client; anything unknown shares one label value
+# so a caller cannot create unbounded series
+DOC_TYPE_LABELS = ("marksheet", "aadhaar", "bills")
+
+def doc_type_label(doc_type):
+    return doc_type if doc_type in DOC_TYPE_LABELS else "other"
+
+# --- Per-request trace ---
+# The active trace is held in a context variable, so engines can record into
+# it without being passed a handle. Thread pools must copy the context
+# (see run_in_context) for worker threads to see it.
+_current_trace = contextvars.ContextVar("sicario_trace", default=None)
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.ocr_calls = 0
+        self.ocr_winner = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_ocr_call(self):
+        with self._lock:
+            self.ocr_calls += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        with self._lock:
+            breakdown = {
+                "total_ms": round(self.elapsed() * 1000, 2),
+                "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+                "ocr_calls": self.ocr_calls
+            }
+            if self.ocr_winner:
+                breakdown["ocr_winner"] = self.ocr_winner
+            return breakdown
+
+@contextmanager
+def trace_request():
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, seconds)
+
+def record_ocr_call(caller, strategy, config):
+    OCR_CALLS.inc(caller, strategy, config)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_ocr_call()
+
+def record_aadhaar_winner(strategy, config):
+    AADHAAR_WINNER.inc(strategy, config)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.ocr_winner = {"strategy": strategy, "config": config}
+
+def run_in_context(executor, fn, *args):
+    # executor.submit() that carries the caller's trace into the worker thread
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args)
@@ -0,0 +1,169 @@
+import os
+import queue
+import shlex
+import threading
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# --- OCR backends ---
+# Every OCR call in the engines goes through one of these, taking an
+# in-memory array (or PIL image) and a pytesseract-style config string.
+#
+#   PytesseractBackend - one tesseract subprocess per call (the fallback)
+#   TesserocrBackend   - long-lived API handles with the language model
+#                        already loaded, pooled per config, fed raw pixels
+#
+# image_to_string returns plain text; image_to_data returns Tesseract's
+# word-level TSV (boxes and confidences), header row included.
+
+TSV_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+def parse_config(config):
+    # "--oem 3 --psm 6 -c key=value -l eng" -> (lang, oem, psm, {key: value})
+    lang, oem, psm, variables = "eng", 3, 3, {}
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--oem":
+            oem = int(args[i + 1]); i += 1
+        elif arg == "--psm":
+            psm = int(args[i + 1]); i += 1
+        elif arg == "-l":
+            lang = args[i + 1]; i += 1
+        elif arg == "-c":
+            key, _, value = args[i + 1].partition("="); i += 1
+            variables[key] = value
+        i += 1
+    return lang, oem, psm, variables
+
+
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def image_to_string(self, image, config=""):
+        return pytesseract.image_to_string(image, config=config)
+
+    def image_to_data(self, image, config=""):
+        return pytesseract.image_to_data(image, config=config)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    name = "tesserocr"
+
+    def __init__(self, max_engines_per_config=2, tessdata_path=None):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.max_engines_per_config = max_engines_per_config
+        self.tessdata_path = tessdata_path or os.environ.get("TESSDATA_PREFIX")
+        self._pools = {}
+        self._created = {}
+        self._lock = threading.Lock()
+
+    def _new_engine(self, config):
+        lang, oem, psm, variables = parse_config(config)
+        kwargs = {"lang": lang, "psm": psm, "oem": oem}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path.rstrip("/") + "/"
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        for key, value in variables.items():
+            engine.SetVariable(key, value)
+        return engine
+
+    def _acquire(self, config):
+        # Engines are created lazily up to the per-config cap, then reused
+        with self._lock:
+            pool = self._pools.setdefault(config, queue.LifoQueue())
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                if self._created.get(config, 0) < self.max_engines_per_config:
+                    self._created[config] = self._created.get(config, 0) + 1
+                    create = True
+                else:
+                    create = False
+        if create:
+            try:
+                return self._new_engine(config)
+            except Exception:
+                with self._lock:
+                    self._created[config] -= 1
+                raise
+        return pool.get()
+
+    def _release(self, config, engine):
+        self._pools[config].put(engine)
+
+    @staticmethod
+    def _set_image(engine, image):
+        if isinstance(image, Image.Image):
+            engine.SetImage(image)
+            return
+        pixels = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = pixels.shape[:2]
+        channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+        engine.SetImageBytes(pixels.tobytes(), width, height, channels, width * channels)
+
+    def _run(self, image, config, read):
+        engine = self._acquire(config)
+        try:
+            self._set_image(engine, image)
+            return read(engine)
+        finally:
+            engine.Clear()
+            self._release(config, engine)
+
+    def image_to_string(self, image, config=""):
+        return self._run(image, config, lambda engine: engine.GetUTF8Text())
+
+    def image_to_data(self, image, config=""):
+        return self._run(image, config, lambda engine: TSV_HEADER + "\n" + engine.GetTSVText(0))
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                while not pool.empty():
+                    pool.get_nowait().End()
+            self._pools.clear()
+            self._created.clear()
+
+
+# --- Backend selection ---
+# OCR_BACKEND=auto (default) uses tesserocr when it is installed and can
+# load a model, otherwise pytesseract. One backend per process.
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_ocr_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(os.environ.get("OCR_BACKEND", "auto"))
+        return _backend
+
+def _create_backend(choice):
+    if choice == "pytesseract":
+        return PytesseractBackend()
+
+    max_engines = int(os.environ.get("OCR_ENGINES_PER_CONFIG", "2"))
+    if choice == "tesserocr":
+        return TesserocrBackend(max_engines)
+
+    if tesserocr is not None:
+        backend = TesserocrBackend(max_engines)
+        try:
+            # Make sure a model actually loads before committing to it
+            backend._release("", backend._acquire(""))
+            return backend
+        except Exception:
+            backend.close()
+    return PytesseractBackend()
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+# --- PDF ingestion ---
+# PDFs are opened with PyMuPDF, or pypdfium2 when PyMuPDF is missing; both
+# are optional. Pages come out one at a time, so only the pages being
+# analyzed are held in memory. Each page carries:
+#   bgr        - the page rendered at PDF_DPI (capped by a pixel budget)
+#   image_data - for a scanned page that is a single embedded JPEG/PNG,
+#                that image's original bytes instead of a re-render, so
+#                ELA and metadata see the real compression history
+#   text       - the embedded text layer; when it has content, checks use
+#                it instead of running OCR
+
+PDF_DPI = int(os.environ.get("PDF_DPI", "200"))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "50"))
+
+# Fewer characters than this counts as no text layer (e.g. scanner stamps)
+MIN_TEXT_CHARS = 16
+
+# A single image covering this much of the page makes it a scan
+SCAN_COVERAGE = 0.8
+
+def is_pdf(data):
+    # The header may be preceded by up to 1 KiB of junk
+    return b"%PDF-" in data[:1024]
+
+
+class PdfPage:
+    def __init__(self, number, text, bgr=None, image_data=None):
+        self.number = number
+        self.text = text if len(text.strip()) >= MIN_TEXT_CHARS else ""
+        self.bgr = bgr
+        self.image_data = image_data
+
+    @property
+    def source(self):
+        return "embedded image" if self.image_data is not None else "rendered"
+
+
+def _render_scale(width_pt, height_pt, dpi, max_pixels):
+    # Points -> pixels at dpi, lowered if the page would exceed max_pixels
+    scale = dpi / 72.0
+    pixels = width_pt * scale * height_pt * scale
+    if max_pixels and pixels > max_pixels:
+        scale *= (max_pixels / pixels) ** 0.5
+    return scale
+
+
+class _PyMuPDFSource:
+    def __init__(self, data):
+        self.doc = pymupdf.open(stream=data, filetype="pdf")
+        self.page_count = self.doc.page_count
+        meta = self.doc.metadata or {}
+        self.metadata = {
+            "Creator": meta.get("creator") or "",
+            "Producer": meta.get("producer") or "",
+            "CreationDate": meta.get("creationDate") or "",
+            "ModDate": meta.get("modDate") or "",
+        }
+
+    def _scan_image(self, page):
+        images = page.get_images(full=True)
+        if len(images) != 1:
+            return None
+        xref = images[0][0]
+        page_area = abs(page.rect)
+        covered = sum(abs(r) for r in page.get_image_rects(xref))
+        if page_area <= 0 or covered < SCAN_COVERAGE * page_area:
+            return None
+        extracted = self.doc.extract_image(xref)
+        if extracted and extracted.get("ext") in ("jpeg", "jpg", "png"):
+            return extracted["image"]
+        return None
+
+    def pages(self, dpi, max_pixels, limit):
+        for index in range(min(self.page_count, limit)):
+            page = self.doc[index]
+            text = page.get_text()
+            image_data = None if text.strip() else self._scan_image(page)
+            if image_data is not None:
+                yield PdfPage(index + 1, text, image_data=image_data)
+                continue
+            scale = _render_scale(page.rect.width, page.rect.height, dpi, max_pixels)
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), colorspace=pymupdf.csRGB, alpha=False)
+            rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+            yield PdfPage(index + 1, text, bgr=np.ascontiguousarray(rgb[:, :, ::-1]))
+
+    def close(self):
+        self.doc.close()
+
+
+class _PdfiumSource:
+    def __init__(self, data):
+        self.doc = pypdfium2.PdfDocument(data)
+        self.page_count = len(self.doc)
+        meta = self.doc.get_metadata_dict()
+        self.metadata = {key: meta.get(key) or "" for key in ("Creator", "Producer", "CreationDate", "ModDate")}
+
+    def pages(self, dpi, max_pixels, limit):
+        for index in range(min(self.page_count, limit)):
+            page = self.doc[index]
+            text = page.get_textpage().get_text_bounded()
+            width, height = page.get_size()
+            # Renders BGR, which is what the checks expect
+            bitmap = page.render(scale=_render_scale(width, height, dpi, max_pixels))
+            yield PdfPage(index + 1, text, bgr=np.ascontiguousarray(bitmap.to_numpy()[:, :, :3]))
+
+    def close(self):
+        self.doc.close()
+
+
+def open_pdf(data):
+    if pymupdf is not None:
+        return _PyMuPDFSource(data)
+    if pypdfium2 is not None:
+        return _PdfiumSource(data)
+    raise RuntimeError("PDF support needs PyMuPDF or pypdfium2 (pip install pymupdf)")
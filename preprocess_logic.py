@@ -0,0 +1,160 @@
+import cv2
+import threading
+import numpy as np
+from layout_logic import read_layout
+from ocr_logic import get_ocr_backend
+
+# --- Shared, lazily computed preprocessing intermediates ---
+# One pipeline is built per request. Every intermediate (grayscale, Otsu,
+# OCR-scaled copies, the OCR layout, ...) is computed the first time it is
+# asked for and then reused by every check that needs it.
+class PreprocessingPipeline:
+    # OCR copies are resized so that a typical text line is about
+    # OCR_TEXT_HEIGHT pixels tall: small print is upscaled (at most
+    # MAX_UPSCALE), large print is shrunk, and the result never exceeds
+    # OCR_MAX_PIXELS.
+    OCR_TEXT_HEIGHT = 32
+    MAX_UPSCALE = 2.0
+    OCR_MAX_PIXELS = 12_000_000
+
+    def __init__(self, bgr_image):
+        if bgr_image is None:
+            raise ValueError("Could not load image file.")
+        self.original = bgr_image
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, build):
+        # Intermediates may be requested from OCR worker threads
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = build()
+            return self._cache[name]
+
+    # --- Native resolution ---
+    @property
+    def gray(self):
+        return self._get("gray", lambda: cv2.cvtColor(self.original, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def otsu(self):
+        return self._get("otsu", lambda: otsu_threshold(self.gray))
+
+    @property
+    def text_lines(self):
+        return self._get("text_lines", lambda: find_text_lines(self.gray))
+
+    def fit(self, max_pixels):
+        # The original, or an area-downscaled copy of at most max_pixels
+        return self._get(("fit", max_pixels), lambda: fit_to_pixels(self.original, max_pixels))
+
+    def reduced_gray(self, max_pixels):
+        # Grayscale shrunk by a power-of-two factor to at most max_pixels;
+        # see reduce_to_pixels
+        return self._get(("reduced_gray", max_pixels), lambda: reduce_to_pixels(self.gray, max_pixels))
+
+    # --- Scaled for OCR ---
+    @property
+    def ocr_scale(self):
+        return self._get("ocr_scale", self._estimate_ocr_scale)
+
+    def _estimate_ocr_scale(self):
+        heights = [h for _, _, _, h in self.text_lines]
+        if heights:
+            scale = min(self.MAX_UPSCALE, self.OCR_TEXT_HEIGHT / float(np.median(heights)))
+        else:
+            scale = self.MAX_UPSCALE
+        height, width = self.original.shape[:2]
+        return min(scale, (self.OCR_MAX_PIXELS / float(height * width)) ** 0.5)
+
+    @property
+    def ocr_color(self):
+        return self._get("ocr_color", lambda: resize_by(self.original, self.ocr_scale))
+
+    @property
+    def ocr_gray(self):
+        return self._get("ocr_gray", lambda: cv2.cvtColor(self.ocr_color, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def ocr_otsu(self):
+        return self._get("ocr_otsu", lambda: otsu_threshold(self.ocr_gray))
+
+    @property
+    def ocr_adaptive(self):
+        return self._get("ocr_adaptive", lambda: adaptive_threshold(self.ocr_gray))
+
+    # --- Structured OCR ---
+    @property
+    def layout(self):
+        # The document's single word-level OCR pass; see layout_logic
+        return self.layout_for(get_ocr_backend())
+
+    def layout_for(self, ocr):
+        # The layout as read by a given OCR backend (an analyzer may be
+        # built with its own); cached per backend
+        return self._get(("layout", ocr), lambda: read_layout(self, ocr))
+
+
+def resize_by(image, scale):
+    if abs(scale - 1.0) < 0.05:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+def fit_to_pixels(image, max_pixels):
+    height, width = image.shape[:2]
+    if height * width <= max_pixels:
+        return image
+    return resize_by(image, (max_pixels / float(height * width)) ** 0.5)
+
+def reduce_to_pixels(image, max_pixels):
+    # Like fit_to_pixels, but by a power-of-two factor k: each output pixel
+    # is the mean of one k x k input block, so content moved by a multiple
+    # of k (e.g. along the 8-pixel JPEG grid) stays pixel-identical
+    height, width = image.shape[:2]
+    factor = 1
+    while height * width > max_pixels * factor * factor:
+        factor *= 2
+    if factor == 1:
+        return image
+    height, width = height // factor, width // factor
+    return cv2.resize(image[:height * factor, :width * factor], (width, height), interpolation=cv2.INTER_AREA)
+
+def otsu_threshold(gray):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+def adaptive_threshold(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+def find_text_lines(gray):
+    # Locates dark text lines on a light background with morphology alone
+    # (no OCR). Returns (x, y, w, h) boxes at native resolution, one per
+    # line, with words on the same row merged together.
+    height = gray.shape[0]
+    unit = max(1, height // 100)  # kernel sizes follow the image size
+    blackhat = cv2.morphologyEx(
+        gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (6 * unit + 1, 6 * unit + 1)))
+    grad = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=3))
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    join = cv2.getStructuringElement(cv2.MORPH_RECT, (4 * unit + 1, unit + 1))
+    mask = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, join)
+    mask = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, join)
+    mask = cv2.erode(mask, None, iterations=1)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = sorted((cv2.boundingRect(c) for c in contours), key=lambda b: b[0])
+
+    lines = []
+    for x, y, w, h in boxes:
+        for i, (lx, ly, lw, lh) in enumerate(lines):
+            overlap = min(y + h, ly + lh) - max(y, ly)
+            gap = x - (lx + lw)
+            if overlap > 0.5 * min(h, lh) and gap < 1.5 * max(h, lh):
+                nx, ny = min(lx, x), min(ly, y)
+                lines[i] = (nx, ny, max(lx + lw, x + w) - nx, max(ly + lh, y + h) - ny)
+                break
+        else:
+            lines.append((x, y, w, h))
+    return lines
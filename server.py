@@ -1,14 +1,22 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, request, jsonify, send_file, send_from_directory
 import os
-from backend_logic import ForgeryDetector
-from aadhaar_logic import AadhaarAnalyzer
+import mimetypes
+import re
+import sqlite3
+from analysis_logic import (ENGINE_VERSION, analyze_and_certify, get_fingerprint_index, is_cacheable, read_and_hash,
+                            resolve_policy)
+from cache_logic import ResultCache
+from jobs_logic import JobManager, QueueFull
+from batch_logic import BatchRunner, extract_zip, stream_ndjson
+from certificate_logic import ensure_certificate
+from document_logic import DecodedDocument, ImageTooLarge
+from storage_logic import ContentStore, StorageJanitor
+from metrics_logic import (OCR_CALLS_PER_REQUEST, REQUEST_SECONDS, doc_type_label, render_metrics, stage,
+                           trace_request)
 from flask_cors import CORS
 import uuid
-import hashlib
-from datetime import datetime
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
+import shutil
+import tempfile
 
 # -------------------- App Setup --------------------
 
@@ -23,61 +31,165 @@ CERT_FOLDER = 'certificates'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CERT_FOLDER, exist_ok=True)
 
-# -------------------- Engines --------------------
+# Uploads are hashed and analyzed from memory; set KEEP_UPLOADS=0 to skip
+# storing a copy of each original on disk.
+KEEP_UPLOADS = os.environ.get("KEEP_UPLOADS", "1") == "1"
 
-aadhaar_engine = AadhaarAnalyzer()
+# -------------------- File Storage --------------------
 
-# -------------------- Utilities --------------------
-
-def calculate_sha256(filepath):
-    sha256_hash = hashlib.sha256()
-    with open(filepath, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+# Uploads (and their ELA visuals) live in a content-addressed store keyed
+# by the upload's SHA-256, so resubmitting a file stores nothing new.
+upload_store = ContentStore(UPLOAD_FOLDER)
 
-def generate_certificate(cert_id, filename, file_hash, analysis_type, timestamp):
-    cert_path = os.path.join(CERT_FOLDER, f"{cert_id}.pdf")
-    c = canvas.Canvas(cert_path, pagesize=letter)
-    width, height = letter
+def _env_number(name, default=None, scale=1):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return float(value) * scale
 
-    c.setStrokeColor(colors.darkblue)
-    c.setLineWidth(5)
-    c.rect(30, 30, width - 60, height - 60)
+# JOBS_DIR holds one JSON record per background job; see Job Queue below
+JOBS_DIR = os.environ.get("JOBS_DIR", "jobs")
 
-    c.setFont("Helvetica-Bold", 30)
-    c.drawCentredString(width / 2, height - 100, "CERTIFICATE OF ANALYSIS")
+# Fingerprints of prior submissions are kept for FINGERPRINT_TTL (and at
+# most FINGERPRINT_MAX_ROWS of them); see fingerprint_logic.
+FINGERPRINT_TTL = _env_number("FINGERPRINT_TTL", 180 * 24 * 3600)
+FINGERPRINT_MAX_ROWS = _env_number("FINGERPRINT_MAX_ROWS")
 
-    c.setFont("Helvetica", 12)
-    c.drawCentredString(width / 2, height - 130, "Sicario Forensic Document Analyzer")
+def prune_fingerprints():
+    # A locked or unwritable index is retried on the next sweep
+    try:
+        index = get_fingerprint_index()
+        return index.prune(FINGERPRINT_TTL, FINGERPRINT_MAX_ROWS) if index is not None else 0
+    except (sqlite3.Error, OSError):
+        return 0
+
+# Retention, checked every STORAGE_SWEEP_SECONDS. Certificate PDFs are
+# re-rendered on demand from their .json records, so they can be evicted
+# freely; the records themselves are only removed if CERT_RECORD_TTL is set.
+# Job records are only needed while clients poll, so they expire after
+# JOB_TTL.
+janitor = StorageJanitor([
+    (UPLOAD_FOLDER, _env_number("UPLOAD_TTL", 7 * 24 * 3600), _env_number("UPLOAD_MAX_MB", None, 1024 * 1024), None),
+    (CERT_FOLDER, _env_number("CERT_TTL", 24 * 3600), _env_number("CERT_MAX_MB", None, 1024 * 1024), re.compile(r"\.pdf$")),
+    (CERT_FOLDER, _env_number("CERT_RECORD_TTL"), None, re.compile(r"\.json$")),
+    (JOBS_DIR, _env_number("JOB_TTL", 24 * 3600), None, re.compile(r"\.json$")),
+], interval=_env_number("STORAGE_SWEEP_SECONDS", 600), hooks=[prune_fingerprints]).start()
+
+# FILE_OFFLOAD=x-sendfile (Apache/lighttpd) or x-accel (nginx) hands file
+# bodies to the front-end server. For x-accel, X_ACCEL_PREFIX is an
+# internal nginx location aliased to this app's working directory.
+FILE_OFFLOAD = os.environ.get("FILE_OFFLOAD", "")
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "/protected").rstrip("/")
+app.config["USE_X_SENDFILE"] = FILE_OFFLOAD == "x-sendfile"
+
+# Werkzeug spills multipart files above 500 KB to a temp file. The
+# single-document routes spool them in memory up to MEMORY_UPLOAD_MB
+# instead, so a normal upload never touches the disk before it is hashed
+# and decoded; /batch, which takes many files, keeps the default. Request
+# bodies above MAX_UPLOAD_MB are refused with 413.
+MEMORY_UPLOAD_LIMIT = int(os.environ.get("MEMORY_UPLOAD_MB", "32")) * 1024 * 1024
+MEMORY_UPLOAD_ENDPOINTS = {"analyze_document", "submit_job"}
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in MEMORY_UPLOAD_ENDPOINTS:
+            return tempfile.SpooledTemporaryFile(max_size=MEMORY_UPLOAD_LIMIT, mode="rb+")
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = UploadRequest
+
+# -------------------- Result Cache --------------------
+
+# RESULT_CACHE_DIR enables the on-disk tier shared between gunicorn workers
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_SIZE", "256")),
+    ttl=int(os.environ.get("RESULT_CACHE_TTL", "3600")),
+    disk_dir=os.environ.get("RESULT_CACHE_DIR") or None
+)
+
+# -------------------- Job Queue --------------------
+
+# JOBS_DIR lets any gunicorn worker answer status requests for any job
+job_manager = JobManager(
+    max_workers=int(os.environ.get("JOB_WORKERS", "2")),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", "32")),
+    jobs_dir=JOBS_DIR
+)
+
+# -------------------- Batch Pool --------------------
+
+batch_runner = BatchRunner(int(os.environ.get("BATCH_WORKERS", "0")) or None)
 
-    y_pos = height - 200
+# -------------------- Utilities --------------------
 
-    def draw(label, value):
-        nonlocal y_pos
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(100, y_pos, label)
-        c.setFont("Helvetica", 14)
-        c.drawString(250, y_pos, value)
-        y_pos -= 40
+def receive_upload():
+    # Returns ((file, doc_type, policy, data, file_hash), None) or
+    # (None, error response). The request stream is read exactly once;
+    # hashing happens as the bytes arrive.
+    if 'file' not in request.files:
+        return None, (jsonify({"error": "No file part"}), 400)
 
-    draw("Reference ID:", cert_id)
-    draw("File Name:", filename)
-    draw("Analysis Type:", analysis_type)
-    draw("Timestamp:", timestamp)
+    file = request.files['file']
+    doc_type = request.form.get('doc_type', 'marksheet')
 
-    y_pos -= 20
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(100, y_pos, "SHA-256 Secure Hash:")
-    c.setFont("Courier", 10)
-    c.drawString(100, y_pos - 20, file_hash)
+    if file.filename == '':
+        return None, (jsonify({"error": "No selected file"}), 400)
 
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawCentredString(width / 2, 60, "This document certifies that the above file has undergone forensic analysis.")
-    c.drawCentredString(width / 2, 45, "Generated by Sicario Secure Layer")
+    try:
+        policy = resolve_policy(request.values.get('policy'))
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
 
-    c.save()
-    return f"{cert_id}.pdf"
+    data, file_hash = read_and_hash(file.stream)
+    try:
+        DecodedDocument.check_upload(data)
+    except ImageTooLarge as e:
+        return None, (jsonify({"error": str(e)}), 413)
+    return (file, doc_type, policy, data, file_hash), None
+
+def persist_upload(file_hash, original_name, data):
+    # Returns the upload's path in the store. Keeping a copy of the original
+    # is optional (KEEP_UPLOADS=0), but its shard directory always exists,
+    # as derived files such as the ELA visual are written next to it.
+    if KEEP_UPLOADS:
+        return upload_store.put(file_hash, data, original_name)
+    shard = upload_store.shard_dir(file_hash)
+    os.makedirs(shard, exist_ok=True)
+    return os.path.join(shard, upload_store.name_for(file_hash, original_name))
+
+def send_stored_file(path, internal_uri, etag=True, max_age=0, immutable=False):
+    # Conditional (ETag/If-None-Match, Last-Modified, Range) file response,
+    # optionally offloaded to the front-end server
+    if FILE_OFFLOAD == "x-accel":
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = internal_uri
+        st = os.stat(path)
+        response.set_etag(etag if isinstance(etag, str) else f"{st.st_mtime_ns:x}-{st.st_size:x}")
+        response.last_modified = st.st_mtime
+        response.make_conditional(request)
+    else:
+        response = send_file(path, etag=etag, max_age=max_age, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+def cache_key(file_hash, doc_type, policy):
+    # An early-exit result must not be served to a caller who asked for all checks
+    return ResultCache.make_key(file_hash, f"{doc_type}-{policy}", ENGINE_VERSION)
+
+def lookup_cached(file_hash, doc_type, policy, display_name):
+    cached = result_cache.get(cache_key(file_hash, doc_type, policy))
+    if cached is not None:
+        cached["filename"] = display_name
+        cached["cached"] = True
+    return cached
+
+def cache_result(file_hash, doc_type, policy, response_data):
+    if is_cacheable(response_data):
+        result_cache.put(cache_key(file_hash, doc_type, policy), response_data)
 
 # -------------------- Routes --------------------
 
@@ -85,105 +197,158 @@ def generate_certificate(cert_id, filename, file_hash, analysis_type, timestamp)
 def health():
     return {"status": "ok"}
 
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/analyze', methods=['POST'])
 def analyze_document():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-
-    file = request.files['file']
-    doc_type = request.form.get('doc_type', 'marksheet')
-
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-
-    filename = f"{uuid.uuid4()}_{file.filename}"
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
+    # Pass timings=1 (query string or form) for a per-stage breakdown and
+    # policy=full|stop_on_fail|fast to choose which checks run
+    with trace_request() as trace:
+        with stage("upload"):
+            upload, error = receive_upload()
+        if error:
+            return error
+        file, doc_type, policy, data, file_hash = upload
+        want_timings = request.values.get("timings") == "1"
+
+        try:
+            with stage("cache_lookup"):
+                cached = lookup_cached(file_hash, doc_type, policy, file.filename)
+            if cached is not None:
+                response_data = cached
+            else:
+                with stage("persist_upload"):
+                    filepath = persist_upload(file_hash, file.filename, data)
+                response_data = analyze_and_certify(
+                    filepath, file.filename, doc_type, file_hash, BASE_URL,
+                    os.path.dirname(filepath), CERT_FOLDER, data, policy
+                )
+                cache_result(file_hash, doc_type, policy, response_data)
+
+            REQUEST_SECONDS.observe(trace.elapsed(), "analyze", doc_type_label(doc_type))
+            OCR_CALLS_PER_REQUEST.observe(trace.ocr_calls, doc_type_label(doc_type))
+            if want_timings:
+                response_data["timings"] = trace.as_dict()
+            return jsonify(response_data)
+
+        except ImageTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    upload, error = receive_upload()
+    if error:
+        return error
+    file, doc_type, policy, data, file_hash = upload
 
     try:
-        file_hash = calculate_sha256(filepath)
-        cert_id = str(uuid.uuid4()).upper()
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        response_data = {}
-
-        if doc_type == 'aadhaar':
-            result = aadhaar_engine.analyze(filepath)
-
-            response_data = {
-                "filename": file.filename,
-                "checks": {
-                    "Aadhaar Number": {
-                        "status": result["status"],
-                        "details": result["details"]
-                    },
-                    "Structural Check": {
-                        "status": "Pass" if result["verhoeff_valid"] else "Fail",
-                        "details": "Verhoeff Algorithm Validation"
-                    },
-                    "Database Check": {
-                        "status": "Pass" if result["db_valid"] else "Fail",
-                        "details": "ID existence in authorized DB"
-                    }
-                },
-                "ela_url": None
-            }
-
-        elif doc_type == 'bills':
-            response_data = {
-                "filename": file.filename,
-                "checks": {
-                    "Digital Tampering (ELA)": {
-                        "status": "Fail",
-                        "details": "High compression artifacts detected near 'Total Amount' field."
-                    },
-                    "Metadata Analysis": {
-                        "status": "Warn",
-                        "details": "Software: 'Adobe Photoshop 2024' found in EXIF tags."
-                    },
-                    "Font Consistency": {
-                        "status": "Fail",
-                        "details": "Detected multiple font families (Arial, Times New Roman) in same line."
-                    },
-                    "Tax Calculation": {
-                        "status": "Pass",
-                        "details": "GST 18% calculation is mathematically correct."
-                    }
-                },
-                "ela_url": None
-            }
-
+        cached = lookup_cached(file_hash, doc_type, policy, file.filename)
+        if cached is not None:
+            job_id = job_manager.add_finished(cached)
         else:
-            detector = ForgeryDetector(filepath)
-            detector.perform_ela(output_dir=UPLOAD_FOLDER)
-            detector.check_metadata()
-            detector.verify_logical_consistency()
-
-            response_data = detector.report_data
-
-            if response_data.get("ela_path"):
-                response_data["ela_url"] = f"{BASE_URL}/uploads/{response_data['ela_path']}"
-
-        cert_filename = generate_certificate(cert_id, file.filename, file_hash, doc_type.upper(), timestamp)
+            # The bytes travel to the pool worker; no temp file is needed
+            filepath = persist_upload(file_hash, file.filename, data)
+            job_id = job_manager.submit(
+                analyze_and_certify,
+                filepath, file.filename, doc_type,
+                file_hash, BASE_URL, os.path.dirname(filepath), CERT_FOLDER, data, policy,
+                on_done=lambda result: cache_result(file_hash, doc_type, policy, result)
+            )
+
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        response_data["security"] = {
-            "file_hash": file_hash,
-            "cert_id": cert_id,
-            "cert_url": f"{BASE_URL}/certificates/{cert_filename}"
-        }
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"{BASE_URL}/jobs/{job_id}",
+        "result_url": f"{BASE_URL}/jobs/{job_id}/result"
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] == "failed":
+        return jsonify({"error": job["error"]}), 500
+    if job["status"] != "done":
+        return jsonify({"job_id": job_id, "status": job["status"]}), 202
+    return jsonify(job["result"])
+
+@app.route('/batch', methods=['POST'])
+def analyze_batch():
+    # Accepts many 'files' and/or .zip archives; streams NDJSON results
+    uploads = request.files.getlist('files')
+    doc_type = request.form.get('doc_type', 'marksheet')
+    if not uploads:
+        return jsonify({"error": "No files"}), 400
+    try:
+        policy = resolve_policy(request.values.get('policy'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    batch_dir = os.path.join(UPLOAD_FOLDER, f"batch_{uuid.uuid4()}")
+    os.makedirs(batch_dir)
+
+    items = []
+    for i, file in enumerate(uploads):
+        if file.filename == '':
+            continue
+        path = os.path.join(batch_dir, f"{i}_{os.path.basename(file.filename)}")
+        file.save(path)
+        if file.filename.lower().endswith('.zip'):
+            try:
+                items.extend(extract_zip(path, batch_dir))
+            except ValueError as e:
+                shutil.rmtree(batch_dir, ignore_errors=True)
+                return jsonify({"error": str(e)}), 400
+            os.remove(path)
+        else:
+            items.append((path, file.filename))
 
-        return jsonify(response_data)
+    def generate():
+        try:
+            yield from stream_ndjson(batch_runner, items, doc_type, policy=policy)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return Response(generate(), mimetype='application/x-ndjson')
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_file(os.path.join(UPLOAD_FOLDER, filename))
+    path = upload_store.path_for(filename)
+    if path is None:
+        # Files saved before the content-addressed store
+        return send_from_directory(UPLOAD_FOLDER, filename)
+    if not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+
+    internal_uri = f"{X_ACCEL_PREFIX}/{UPLOAD_FOLDER}/{upload_store.relative_path(filename)}"
+    if upload_store.is_original(filename):
+        # The upload itself: its name is its content hash, so it never changes
+        return send_stored_file(path, internal_uri, etag=filename, max_age=365 * 24 * 3600, immutable=True)
+    return send_stored_file(path, internal_uri, max_age=3600)
 
 @app.route('/certificates/<filename>')
 def serve_certificate(filename):
-    return send_file(os.path.join(CERT_FOLDER, filename))
+    # Renders the PDF on first download from the stored analysis fields
+    cert_path = ensure_certificate(filename, CERT_FOLDER)
+    if cert_path is None:
+        return jsonify({"error": "Certificate not found"}), 404
+    return send_stored_file(cert_path, f"{X_ACCEL_PREFIX}/{CERT_FOLDER}/{filename}", max_age=24 * 3600)
 
 # -------------------- Entry --------------------
 
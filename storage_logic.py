@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+import time
+
+# --- Content-addressed file store ---
+# Files are named by the SHA-256 of the upload they belong to and sharded
+# two levels deep on the digest, so no directory grows unbounded:
+#   <root>/ab/cd/abcd...ef.jpg          the upload itself
+#   <root>/ab/cd/ela_abcd...ef.jpg      derived files (e.g. ELA visuals)
+# Resubmitting the same bytes reuses the stored copy; the write is skipped
+# and the file's mtime is refreshed, which is what retention looks at.
+
+STORED_NAME = re.compile(r"^(?:[a-z]+_)?([0-9a-f]{64})[\w.-]*$")
+
+class ContentStore:
+    def __init__(self, root, shard_levels=2, shard_width=2):
+        self.root = root
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        os.makedirs(root, exist_ok=True)
+
+    def shard_dir(self, digest):
+        w = self.shard_width
+        parts = [digest[i * w:(i + 1) * w] for i in range(self.shard_levels)]
+        return os.path.join(self.root, *parts)
+
+    @staticmethod
+    def name_for(digest, original_name=""):
+        ext = os.path.splitext(original_name)[1].lower()
+        return f"{digest}{ext}" if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else digest
+
+    def path_for(self, name):
+        # Absolute location of a stored name, or None if it is not one;
+        # this is also what keeps request paths inside the store.
+        match = STORED_NAME.match(name)
+        if match is None:
+            return None
+        return os.path.join(self.shard_dir(match.group(1)), name)
+
+    @staticmethod
+    def is_original(name):
+        # The upload itself rather than a file derived from it
+        return re.match(r"[0-9a-f]{64}(?:\.|$)", name) is not None
+
+    def relative_path(self, name):
+        return os.path.relpath(self.path_for(name), self.root).replace(os.sep, "/")
+
+    def put(self, digest, data, original_name=""):
+        # Returns the stored path; identical content is only written once
+        name = self.name_for(digest, original_name)
+        path = self.path_for(name)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+
+# --- Retention ---
+def evict(root, max_age=None, max_bytes=None, pattern=None, now=None):
+    # Deletes files under root older than max_age seconds, then the least
+    # recently touched ones until the total is under max_bytes. pattern
+    # (a compiled regex on the file name) limits which files are managed.
+    # Returns (files removed, bytes freed).
+    now = time.time() if now is None else now
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".tmp") or (pattern is not None and not pattern.search(filename)):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for mtime, size, path in entries:
+        expired = max_age is not None and now - mtime > max_age
+        over_budget = max_bytes is not None and total > max_bytes
+        if not (expired or over_budget):
+            # Sorted oldest first: nothing later is expired either
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+class StorageJanitor:
+    # Runs evict() over each target every `interval` seconds on a daemon
+    # thread. Under gunicorn every worker runs one; concurrent deletes of
+    # the same file are harmless. Stores that are not plain files (e.g. a
+    # SQLite index) register a callable in `hooks` that prunes them.
+    def __init__(self, targets, interval=600, hooks=()):
+        # targets: [(root, max_age, max_bytes, pattern)]
+        self.targets = [t for t in targets if t[1] is not None or t[2] is not None]
+        self.hooks = list(hooks)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        results = [evict(root, max_age, max_bytes, pattern) for root, max_age, max_bytes, pattern in self.targets]
+        return results + [hook() for hook in self.hooks]
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except OSError:
+                pass
+
+    def start(self):
+        if (self.targets or self.hooks) and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="storage-janitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
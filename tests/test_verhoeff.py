@@ -0,0 +1,21 @@
+import numpy as np
+from aadhaar_logic import VerhoeffValidator
+
+
+def test_validate_ids_matches_validate():
+    validator = VerhoeffValidator()
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 10 ** 12, size=200_000, dtype=np.int64)
+    # Leading zeros are rare in uniform draws; make sure they are covered
+    ids[:20_000] //= 10 ** rng.integers(1, 12, size=20_000)
+
+    expected = np.array([validator.validate(f"{i:012d}") for i in ids])
+    assert expected.any() and (~expected).any()
+    assert np.array_equal(validator.validate_ids(ids), expected)
+    assert np.array_equal(validator.validate_digits([[int(d) for d in f"{i:012d}"] for i in ids[:1000]]),
+                          expected[:1000])
+
+
+def test_validate_ids_rejects_out_of_range():
+    validator = VerhoeffValidator()
+    assert not validator.validate_ids([-1, 10 ** 12]).any()
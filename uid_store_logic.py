@@ -0,0 +1,277 @@
+import argparse
+import math
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import numpy as np
+
+# --- Authorized UID stores ---
+# Every store holds Aadhaar numbers as packed 12-digit integers and
+# answers contains(uid_int). The file-backed stores are opened read-only
+# and shared through the OS page cache, so gunicorn workers do not each
+# keep their own copy of the ID list on the Python heap.
+
+class MemoryUIDStore:
+    def __init__(self, uids=()):
+        self.uids = set(int(u) for u in uids)
+
+    def add(self, uid):
+        self.uids.add(int(uid))
+
+    def contains(self, uid):
+        return uid in self.uids
+
+    def __len__(self):
+        return len(self.uids)
+
+
+class SortedArrayUIDStore:
+    # A file of sorted, unique little-endian uint64 values (".u64"),
+    # memory-mapped and searched with a binary search.
+    def __init__(self, path):
+        self.path = path
+        self.uids = open_u64(path)
+
+    def contains(self, uid):
+        # Search with a uint64 key; a Python int would upcast the whole map
+        i = int(np.searchsorted(self.uids, np.uint64(uid)))
+        return i < len(self.uids) and int(self.uids[i]) == uid
+
+    def __len__(self):
+        return len(self.uids)
+
+
+def open_u64(path):
+    # Read-only map of a .u64 file; np.memmap cannot map an empty file
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype='<u8')
+    return np.memmap(path, dtype='<u8', mode='r')
+
+
+class SQLiteUIDStore:
+    # A single-column WITHOUT ROWID table, so the primary key B-tree is
+    # the whole table. One read-only connection per thread.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def contains(self, uid):
+        row = self._conn().execute("SELECT 1 FROM uids WHERE uid = ?", (uid,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM uids").fetchone()[0]
+
+
+# --- Bloom filter front ---
+def _mix64(values):
+    # splitmix64 finalizer; uint64 arithmetic wraps as intended
+    z = np.asarray(values, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+_MASK64 = (1 << 64) - 1
+
+def _mix64_int(z):
+    # Scalar twin of _mix64; avoids NumPy call overhead on single lookups
+    z = (z + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+class BloomFilter:
+    # File layout (".bloom"): uint64 num_bits, uint64 num_hashes, then the
+    # bit array. Positions use double hashing: h1 + i * h2.
+    HEADER_BYTES = 16
+    # IDs hashed per step of add_many; positions are an (n, num_hashes)
+    # uint64 matrix
+    ADD_CHUNK = 1 << 18
+
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = int(num_bits)
+        self.num_hashes = int(num_hashes)
+        if bits is None:
+            bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.bits = bits
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=0.01):
+        num_bits = max(64, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        num_hashes = max(1, int(round(num_bits / max(capacity, 1) * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, uids):
+        h1 = _mix64(uids)
+        h2 = _mix64(h1) | np.uint64(1)
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add_many(self, uids):
+        for start in range(0, len(uids), self.ADD_CHUNK):
+            pos = self._positions(uids[start:start + self.ADD_CHUNK]).ravel()
+            np.bitwise_or.at(self.bits, (pos >> np.uint64(3)).astype(np.intp),
+                             (np.uint8(1) << (pos & np.uint64(7)).astype(np.uint8)))
+
+    def might_contain_many(self, uids):
+        pos = self._positions(uids)
+        hit = self.bits[(pos >> np.uint64(3)).astype(np.intp)] >> (pos & np.uint64(7)).astype(np.uint8)
+        return np.all(hit & 1, axis=1)
+
+    def might_contain(self, uid):
+        h1 = _mix64_int(uid)
+        h2 = _mix64_int(h1) | 1
+        bits = self.bits
+        for i in range(self.num_hashes):
+            pos = ((h1 + i * h2) & _MASK64) % self.num_bits
+            if not (bits[pos >> 3] >> (pos & 7)) & 1:
+                return False
+        return True
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(np.array([self.num_bits, self.num_hashes], dtype='<u8').tobytes())
+            f.write(self.bits.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        num_bits, num_hashes = np.fromfile(path, dtype='<u8', count=2)
+        bits = np.memmap(path, dtype=np.uint8, mode='r', offset=cls.HEADER_BYTES)
+        return cls(num_bits, num_hashes, bits)
+
+class BloomFrontedStore:
+    # Definite negatives are answered by the filter without touching the store
+    def __init__(self, store, bloom):
+        self.store = store
+        self.bloom = bloom
+
+    def contains(self, uid):
+        return self.bloom.might_contain(uid) and self.store.contains(uid)
+
+    def __len__(self):
+        return len(self.store)
+
+
+def open_uid_store(path):
+    # Picks the backend from the extension; "<path>.bloom" is used if present
+    if path.endswith(".u64"):
+        store = SortedArrayUIDStore(path)
+    elif path.endswith((".sqlite", ".sqlite3", ".db")):
+        store = SQLiteUIDStore(path)
+    else:
+        raise ValueError(f"Unknown UID store format: {path}")
+
+    bloom_path = f"{path}.bloom"
+    if os.path.exists(bloom_path):
+        store = BloomFrontedStore(store, BloomFilter.load(bloom_path))
+    return store
+
+
+# --- Bulk loader ---
+def read_uid_file(path, chunk_lines=1_000_000):
+    # Yields int64 arrays of the 12-digit IDs in a one-ID-per-line file;
+    # spaces and dashes inside an ID are ignored, other lines are skipped.
+    with open(path, "r") as f:
+        while True:
+            lines = f.readlines(chunk_lines * 14)
+            if not lines:
+                return
+            cleaned = [l.replace(" ", "").replace("-", "").strip() for l in lines]
+            yield np.array([int(c) for c in cleaned if len(c) == 12 and c.isdigit()], dtype=np.int64)
+
+def write_runs(input_path, run_dir):
+    # One sorted, de-duplicated .u64 run per read_uid_file chunk
+    runs = []
+    for chunk in read_uid_file(input_path):
+        if len(chunk):
+            path = os.path.join(run_dir, f"run{len(runs)}.u64")
+            np.unique(chunk).astype('<u8').tofile(path)
+            runs.append(path)
+    return runs
+
+def merge_runs(runs, output_path, max_values=8_000_000):
+    # k-way merge of sorted runs into one sorted, unique .u64 file, holding
+    # at most max_values IDs at a time. Each round takes a block from every
+    # run; everything up to the smallest of the blocks' last values is
+    # final, since no run has anything smaller left. Returns the count.
+    arrays = [open_u64(path) for path in runs]
+    offsets = [0] * len(arrays)
+    block = max(1, max_values // max(len(arrays), 1))
+    count = 0
+    with open(output_path, "wb") as out:
+        while True:
+            blocks = [(i, a[offsets[i]:offsets[i] + block]) for i, a in enumerate(arrays) if offsets[i] < len(a)]
+            if not blocks:
+                return count
+            bound = min(b[-1] for _, b in blocks)
+            parts = []
+            for i, b in blocks:
+                n = int(np.searchsorted(b, bound, side="right"))
+                parts.append(b[:n])
+                offsets[i] += n
+            merged = np.unique(np.concatenate(parts))
+            merged.astype('<u8').tofile(out)
+            count += len(merged)
+
+def build_store(input_path, output_path, bloom=False, fp_rate=0.01):
+    # External sort: the input is read in chunks, sorted runs are spilled
+    # next to the output and merged, so memory stays bounded however many
+    # IDs the file holds
+    is_sqlite = output_path.endswith((".sqlite", ".sqlite3", ".db"))
+    if not (is_sqlite or output_path.endswith(".u64")):
+        raise ValueError(f"Unknown UID store format: {output_path}")
+
+    work_dir = tempfile.mkdtemp(prefix="uid_build_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        sorted_path = os.path.join(work_dir, "sorted.u64")
+        count = merge_runs(write_runs(input_path, work_dir), sorted_path)
+        uids = open_u64(sorted_path)
+
+        if is_sqlite:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            conn = sqlite3.connect(output_path)
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE uids (uid INTEGER PRIMARY KEY) WITHOUT ROWID")
+            # Sorted input makes the B-tree build append-only
+            conn.executemany("INSERT INTO uids VALUES (?)", ((int(u),) for u in uids))
+            conn.commit()
+            conn.close()
+
+        if bloom:
+            bloom_filter = BloomFilter.for_capacity(count, fp_rate)
+            bloom_filter.add_many(uids)
+            bloom_filter.save(f"{output_path}.bloom")
+
+        del uids
+        if not is_sqlite:
+            os.replace(sorted_path, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an authorized-UID store from a one-ID-per-line file.")
+    parser.add_argument("input", help="Text file with one 12-digit ID per line")
+    parser.add_argument("output", help="Output store: .u64 (memory-mapped sorted array) or .sqlite")
+    parser.add_argument("--bloom", action="store_true", help="Also write <output>.bloom for fast negatives")
+    parser.add_argument("--fp-rate", type=float, default=0.01, help="Bloom filter false-positive rate")
+    args = parser.parse_args(argv)
+
+    count = build_store(args.input, args.output, args.bloom, args.fp_rate)
+    print(f"Wrote {count} unique IDs to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+from aadhaar_logic import VerhoeffValidator
+
+# --- Offline Verhoeff validation of ID exports ---
+# Streams a CSV (or one-ID-per-line text file) in chunks and validates a
+# whole chunk per NumPy call, so millions of rows take seconds.
+#
+#   python verhoeff_check.py ids.csv --column uid --invalid-out bad.csv
+
+def clean_ids(column):
+    # "1234 5678 9012" -> 123456789012; anything that is not 12 digits -> -1
+    digits = column.astype(str).str.replace(r'[\s-]', '', regex=True)
+    well_formed = digits.str.fullmatch(r'\d{12}')
+    ids = np.full(len(digits), -1, dtype=np.int64)
+    ids[well_formed.to_numpy()] = digits[well_formed].astype(np.int64).to_numpy()
+    return ids
+
+def check_file(path, column=None, chunksize=1_000_000, invalid_out=None):
+    validator = VerhoeffValidator()
+    header = 0 if column is not None else None
+    usecols = [column] if column is not None else [0]
+    reader = pd.read_csv(path, header=header, usecols=usecols, dtype=str,
+                         chunksize=chunksize, skip_blank_lines=True)
+
+    totals = {"rows": 0, "valid": 0, "invalid": 0, "malformed": 0}
+    started = time.perf_counter()
+    out = open(invalid_out, "w") if invalid_out else None
+    try:
+        for chunk in reader:
+            raw = chunk.iloc[:, 0]
+            ids = clean_ids(raw)
+            valid = validator.validate_ids(ids)
+            malformed = ids < 0
+
+            totals["rows"] += len(ids)
+            totals["valid"] += int(valid.sum())
+            totals["malformed"] += int(malformed.sum())
+            totals["invalid"] += int((~valid & ~malformed).sum())
+
+            if out is not None:
+                for value in raw[~valid]:
+                    out.write(f"{value}\n")
+    finally:
+        if out is not None:
+            out.close()
+
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate Aadhaar numbers in bulk with the Verhoeff checksum.")
+    parser.add_argument("path", help="CSV file, or a text file with one ID per line")
+    parser.add_argument("--column", default=None, help="CSV column holding the IDs (default: first column, no header)")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--invalid-out", default=None, help="Write rows that fail validation here")
+    args = parser.parse_args(argv)
+
+    totals = check_file(args.path, args.column, args.chunksize, args.invalid_out)
+    json.dump(totals, sys.stdout)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()